@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# Throughput of the md3 record codec (fmt_md3 / utils.AnyStruct), no Blender needed.
+#
+#   PYTHONPATH=. python benchmarks/bench_codec.py -o bench.json
+#   PYTHONPATH=. python benchmarks/bench_codec.py --quick --compare bench.json
+#
+# Synthetic content is generated over a grid of verts x frames x surfaces x tags,
+# and every case is timed through the scalar (record at a time) path and the batch
+# path. Results go to JSON so runs of different versions can be compared.
+
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+from time import perf_counter
+
+import numpy
+
+import io_scene_md3
+from io_scene_md3 import fmt_md3 as fmt
+
+
+FULL_GRID = {
+    'verts': (100, 1000, 4000),
+    'frames': (1, 50, 200),
+    'surfaces': (1, 4),
+    'tags': (0, 4),
+}
+
+QUICK_GRID = {
+    'verts': (100, 1000),
+    'frames': (1, 20),
+    'surfaces': (1,),
+    'tags': (4,),
+}
+
+
+def make_content(verts, frames, surfaces, tags, seed=0):
+    rnd = numpy.random.RandomState(seed)
+    co = rnd.uniform(-256.0, 256.0, (surfaces, frames, verts, 3))
+    normals = rnd.normal(size=(surfaces, frames, verts, 3))
+    normals /= numpy.linalg.norm(normals, axis=-1, keepdims=True)
+    tag_records = [
+        ('tag_{}'.format(t), tuple(rnd.uniform(-50, 50, 3)), tuple(rnd.uniform(-1, 1, 9)))
+        for _ in range(frames) for t in range(tags)]
+    triangles = [tuple(rnd.randint(0, verts, 3)) for _ in range(surfaces * verts * 2)]
+    return {
+        'co': co,
+        'normals': normals,
+        'vertex_bytes': [fmt.encode_vertices(co[s], normals[s]) for s in range(surfaces)],
+        'tags': tag_records,
+        'tag_bytes': fmt.Tag.pack_many(tag_records),
+        'triangles': triangles,
+        'triangle_bytes': fmt.Triangle.pack_many(triangles),
+    }
+
+
+def vertex_encode_scalar(c):
+    return [
+        b''.join([fmt.Vertex.pack(*v, normal=n)
+                  for v, n in zip(co.reshape(-1, 3).tolist(), nm.reshape(-1, 3).tolist())])
+        for co, nm in zip(c['co'], c['normals'])]
+
+
+def vertex_encode_batch(c):
+    return [fmt.encode_vertices(co, nm) for co, nm in zip(c['co'], c['normals'])]
+
+
+def vertex_decode_scalar(c):
+    size = fmt.Vertex.size
+    return [
+        [fmt.Vertex.unpack(data[i:i + size]) for i in range(0, len(data), size)]
+        for data in c['vertex_bytes']]
+
+
+def vertex_decode_batch(c):
+    frames, verts = c['co'].shape[1:3]
+    return [fmt.decode_vertices(data, verts, frames) for data in c['vertex_bytes']]
+
+
+def normal_encode_scalar(c):
+    return [fmt.encode_normal(n) for n in c['normals'].reshape(-1, 3).tolist()]
+
+
+def normal_encode_batch(c):
+    return fmt.encode_normals(c['normals'])
+
+
+def tag_pack_scalar(c):
+    return b''.join([fmt.Tag.pack(*t) for t in c['tags']])
+
+
+def tag_pack_batch(c):
+    return fmt.Tag.pack_many(c['tags'])
+
+
+def tag_unpack_scalar(c):
+    data, size = c['tag_bytes'], fmt.Tag.size
+    return [fmt.Tag.unpack(data[i:i + size]) for i in range(0, len(data), size)]
+
+
+def tag_unpack_batch(c):
+    return fmt.Tag.unpack_many(c['tag_bytes'], len(c['tags']))
+
+
+def triangle_unpack_scalar(c):
+    data, size = c['triangle_bytes'], fmt.Triangle.size
+    return [fmt.Triangle.unpack(data[i:i + size]) for i in range(0, len(data), size)]
+
+
+def triangle_unpack_batch(c):
+    return fmt.Triangle.unpack_many(c['triangle_bytes'], len(c['triangles']))
+
+
+# name: (record size, count of records, scalar, batch)
+CASES = {
+    'vertex_encode': (fmt.Vertex.size, lambda c: c['co'][..., 0].size, vertex_encode_scalar, vertex_encode_batch),
+    'vertex_decode': (fmt.Vertex.size, lambda c: c['co'][..., 0].size, vertex_decode_scalar, vertex_decode_batch),
+    'normal_encode': (2, lambda c: c['normals'][..., 0].size, normal_encode_scalar, normal_encode_batch),
+    'tag_pack': (fmt.Tag.size, lambda c: len(c['tags']), tag_pack_scalar, tag_pack_batch),
+    'tag_unpack': (fmt.Tag.size, lambda c: len(c['tags']), tag_unpack_scalar, tag_unpack_batch),
+    'triangle_unpack': (
+        fmt.Triangle.size, lambda c: len(c['triangles']), triangle_unpack_scalar, triangle_unpack_batch),
+}
+
+
+def measure(func, content, repeat, budget):
+    'Best of repeat runs, stopping early once budget seconds are spent'
+    best = None
+    spent = 0.0
+    for _ in range(repeat):
+        start = perf_counter()
+        func(content)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        spent += elapsed
+        if spent > budget:
+            break
+    return best
+
+
+def run(grid, cases, repeat, budget, out=sys.stdout):
+    results = []
+    keys = ('verts', 'frames', 'surfaces', 'tags')
+    for values in itertools.product(*(grid[k] for k in keys)):
+        params = dict(zip(keys, values))
+        content = make_content(**params)
+        for name in cases:
+            size, count, scalar, batch = CASES[name]
+            records = count(content)
+            if records == 0:
+                continue
+            for path, func in (('scalar', scalar), ('batch', batch)):
+                seconds = measure(func, content, repeat, budget)
+                result = dict(params, case=name, path=path, records=records, seconds=seconds,
+                              records_per_s=records / seconds, mb_per_s=records * size / seconds / 2 ** 20)
+                results.append(result)
+                print('{case:<16} {path:<6} v={verts:<5} f={frames:<4} s={surfaces} t={tags} '
+                      '{records:>9} rec {records_per_s:>14,.0f} rec/s {mb_per_s:>9.2f} MB/s'.format(**result), file=out)
+    return results
+
+
+def result_key(r):
+    return (r['case'], r['path'], r['verts'], r['frames'], r['surfaces'], r['tags'])
+
+
+def compare(results, baseline, out=sys.stdout):
+    old = {result_key(r): r for r in baseline['results']}
+    print('\nchange against baseline (>1 is faster):', file=out)
+    for r in results:
+        o = old.get(result_key(r))
+        if o is not None:
+            print('{case:<16} {path:<6} v={verts:<5} f={frames:<4} s={surfaces} t={tags} '.format(**r)
+                  + '{:6.2f}x'.format(o['seconds'] / r['seconds']), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='md3 codec throughput benchmark')
+    parser.add_argument('-o', '--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare against')
+    parser.add_argument('--quick', action='store_true', help='small grid for a fast sanity run')
+    parser.add_argument('--case', action='append', choices=sorted(CASES), help='run only these cases')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=2.0, help='max seconds spent per measurement')
+    args = parser.parse_args(argv)
+
+    grid = QUICK_GRID if args.quick else FULL_GRID
+    results = run(grid, args.case or list(CASES), args.repeat, args.budget)
+    report = {
+        'meta': {
+            'version': '.'.join(map(str, io_scene_md3.bl_info['version'])),
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'grid': grid,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 bl_info = {
     "name": "Quake 3 Model (.md3)",
-    "author": "Vitaly Verhovodov", "Aleksander Marhall"
+    "author": "Vitaly Verhovodov, Aleksander Marhall",
     "version": (0, 2, 2),
     "blender": (4, 1, 0),
     "location": "File > Import-Export > Quake 3 Model",
@@ -12,69 +12,13 @@ bl_info = {
 }
 
 
-import bpy
-import struct
-from bpy.props import StringProperty
-from bpy_extras.io_utils import ImportHelper, ExportHelper
+try:
+    import bpy
+except ImportError:
+    bpy = None  # fmt_md3 and md3file also work as plain modules outside of Blender
 
-
-class ImportMD3(bpy.types.Operator, ImportHelper):
-    '''Import a Quake 3 Model MD3 file'''
-    bl_idname = "import_scene.md3"
-    bl_label = 'Import MD3'
-    filename_ext = ".md3"
-    filter_glob = StringProperty(default="*.md3", options={'HIDDEN'})
-
-    def execute(self, context):
-        from .import_md3 import MD3Importer
-        MD3Importer(context)(self.properties.filepath)
-        return {'FINISHED'}
-
-
-class ExportMD3(bpy.types.Operator, ExportHelper):
-    '''Export a Quake 3 Model MD3 file'''
-    bl_idname = "export_scene.md3"
-    bl_label = 'Export MD3'
-    filename_ext = ".md3"
-    filter_glob = StringProperty(default="*.md3", options={'HIDDEN'})
-
-    def execute(self, context):
-        try:
-            from .export_md3 import MD3Exporter
-            MD3Exporter(context)(self.properties.filepath)
-            return {'FINISHED'}
-        except struct.error:
-            self.report({'ERROR'}, "Mesh does not fit within the MD3 model space. Vertex axies locations must be below 512 blender units.")
-        except ValueError as e:
-            self.report({'ERROR'}, str(e))
-        return {'CANCELLED'}
-
-
-def menu_func_import(self, context):
-    self.layout.operator(ImportMD3.bl_idname, text="Quake 3 Model (.md3)")
-
-
-def menu_func_export(self, context):
-    self.layout.operator(ExportMD3.bl_idname, text="Quake 3 Model (.md3)")
-
-
-classes = (
-    ImportMD3,
-    ExportMD3,
-)
-
-def register():
-    for cls in classes:
-        bpy.utils.register_class(cls)
-    bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
-    bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
-
-
-def unregister():
-    for cls in classes:
-        bpy.utils.unregister_class(cls)
-    bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
-    bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
+if bpy is not None:
+    from .operators import register, unregister
 
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+# Reading Quake 3 player animation.cfg files and choosing which md3 frames
+# to import, no Blender needed
+
+
+import os.path
+from collections import namedtuple
+
+import numpy
+
+
+# animation lines are named by their position in the file, like the engine does
+ANIMATION_NAMES = (
+    'BOTH_DEATH1', 'BOTH_DEAD1', 'BOTH_DEATH2', 'BOTH_DEAD2', 'BOTH_DEATH3', 'BOTH_DEAD3',
+    'TORSO_GESTURE', 'TORSO_ATTACK', 'TORSO_ATTACK2', 'TORSO_DROP', 'TORSO_RAISE',
+    'TORSO_STAND', 'TORSO_STAND2',
+    'LEGS_WALKCR', 'LEGS_WALK', 'LEGS_RUN', 'LEGS_BACK', 'LEGS_SWIM', 'LEGS_JUMP', 'LEGS_LAND',
+    'LEGS_JUMPB', 'LEGS_LANDB', 'LEGS_IDLE', 'LEGS_IDLECR', 'LEGS_TURN',
+    'TORSO_GETFLAG', 'TORSO_GUARDBASE', 'TORSO_PATROL', 'TORSO_FOLLOWME', 'TORSO_AFFIRMATIVE',
+    'TORSO_NEGATIVE',
+)
+
+Animation = namedtuple('Animation', 'name firstFrame numFrames loopFrames fps')
+
+
+def parse_animation_cfg(text):
+    '''Returning {name: Animation} of an animation.cfg
+
+    firstFrame of legs animations is shifted down by the torso frames,
+    the same way cg_players.c does, so it indexes lower.md3 frames.
+    '''
+    animations = {}
+    rows = []
+    for line in text.splitlines():
+        tokens = line.split('//', 1)[0].split()
+        if not tokens or not tokens[0].lstrip('-').isdigit():
+            continue  # sex, footsteps, headoffset, fixedlegs, ...
+        if len(rows) == len(ANIMATION_NAMES):
+            break
+        rows.append([int(float(t)) for t in tokens[:4]])
+    legs = ANIMATION_NAMES.index('LEGS_WALKCR')
+    torso = ANIMATION_NAMES.index('TORSO_GESTURE')
+    team = ANIMATION_NAMES.index('TORSO_GETFLAG')
+    skip = rows[legs][0] - rows[torso][0] if len(rows) > legs else 0
+    for i, row in enumerate(rows):
+        if len(row) != 4:
+            raise ValueError('animation.cfg line {} needs 4 numbers'.format(ANIMATION_NAMES[i]))
+        first, num, loop, fps = row
+        if legs <= i < team:
+            first -= skip
+        animations[ANIMATION_NAMES[i]] = Animation(ANIMATION_NAMES[i], first, abs(num), loop, fps)
+    return animations
+
+
+def find_animation_cfg(filename):
+    'Returning path of animation.cfg next to the md3 file, or None'
+    base, _ = os.path.splitext(filename)
+    for path in (base + '_animation.cfg', os.path.join(os.path.dirname(filename), 'animation.cfg')):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+class FrameSelection:
+    '''Frames of an md3 to import
+
+    Frames of the named animations (from the animation.cfg next to the file)
+    or all frames, limited to [start, end] and then taking every step-th.
+    '''
+
+    def __init__(self, start=0, end=None, step=1, animations=()):
+        if step < 1:
+            raise ValueError('Frame step must be at least 1')
+        self.start = start
+        self.end = end
+        self.step = step
+        self.animations = tuple(animations)
+
+    def animation_frames(self, filename):
+        path = find_animation_cfg(filename)
+        if path is None:
+            raise ValueError('No animation.cfg found for {}'.format(filename))
+        with open(path) as f:
+            animations = parse_animation_cfg(f.read())
+        missing = [name for name in self.animations if name not in animations]
+        if missing:
+            raise ValueError('{} has no {}'.format(path, ', '.join(missing)))
+        return numpy.concatenate([
+            numpy.arange(a.firstFrame, a.firstFrame + a.numFrames)
+            for a in (animations[name] for name in self.animations)])
+
+    def frames(self, filename, nFrames):
+        'Returning int array of frame indices, in import order'
+        if self.animations:
+            frames = self.animation_frames(filename)
+        else:
+            frames = numpy.arange(nFrames)
+        end = nFrames - 1 if self.end is None or self.end < 0 else self.end
+        frames = frames[(frames >= self.start) & (frames <= end) & (frames < nFrames)][::self.step]
+        if not len(frames):
+            raise ValueError('No frames selected of {}'.format(nFrames))
+        return frames
@@ -1,4 +1,7 @@
 from math import pi, sin, cos, atan2, acos
+from struct import error as StructError
+
+import numpy
 
 from .utils import AnyStruct
 
@@ -112,5 +115,142 @@ Vertex = AnyStruct('Vertex', (
 ))
 
 
+# Every offset in the file follows from the record counts, so writers can
+# lay everything out before packing anything
+
+def surface_offsets(nShaders, nTris, nVerts, nFrames):
+    'Returning offset fields of a Surface, relative to its start'
+    offShaders = Surface.size
+    offTris = offShaders + nShaders * Shader.size
+    offST = offTris + nTris * Triangle.size
+    offVerts = offST + nVerts * TexCoord.size
+    offEnd = offVerts + nFrames * nVerts * Vertex.size
+    return {
+        'offShaders': offShaders,
+        'offTris': offTris,
+        'offST': offST,
+        'offVerts': offVerts,
+        'offEnd': offEnd,
+    }
+
+
+def header_offsets(nFrames, nTags, surfaces_size=0):
+    'Returning offset fields of a Header, surfaces_size is all surfaces together'
+    offFrames = Header.size
+    offTags = offFrames + nFrames * Frame.size
+    offSurfaces = offTags + nFrames * nTags * Tag.size
+    offEnd = offSurfaces + surfaces_size
+    return {
+        'offFrames': offFrames,
+        'offTags': offTags,
+        'offSurfaces': offSurfaces,
+        'offEnd': offEnd,
+    }
+
+
+# Batch codec for whole vertex blocks: nFrames * nVerts records laid out
+# frame after frame, the same way they are stored in a surface
+
+VertexRecord = numpy.dtype([
+    ('xyz', '<i2', (3,)),
+    ('normal', 'u1', (2,)),
+])
+assert VertexRecord.itemsize == Vertex.size
+
+
+def make_normal_table():
+    'Returning (65536, 3) unit vectors indexed by lat | lon << 8'
+    # same expressions as decode_normal, so every entry matches it exactly
+    angles = [i / 255.0 * 2 * pi for i in range(256)]
+    cos_a = numpy.array([cos(a) for a in angles])
+    sin_a = numpy.array([sin(a) for a in angles])
+    x = cos_a[None, :] * sin_a[:, None]
+    y = sin_a[None, :] * sin_a[:, None]
+    z = numpy.broadcast_to(cos_a[:, None], (256, 256))
+    return numpy.stack((x, y, z), axis=-1).reshape(65536, 3)
+
+
+NORMAL_TABLE = make_normal_table().astype(numpy.float32)
+
+
+def decode_normals(b):
+    b = numpy.asarray(b, dtype=numpy.uint8)
+    return NORMAL_TABLE[b[..., 0] | (b[..., 1].astype(numpy.uint16) << 8)]
+
+
+def near_quantization_edge(q):
+    return numpy.abs(q - numpy.round(q)) < 1e-9
+
+
+def encode_normals(n):
+    n = numpy.asarray(n, dtype=numpy.float64).copy()
+    x, y, z = n[..., 0], n[..., 1], numpy.clip(n[..., 2], -1.0, 1.0, out=n[..., 2])
+    lon = numpy.arctan2(y, x) * 255 / (2 * pi)
+    lat = numpy.arccos(z) * 255 / (2 * pi)
+    result = numpy.stack((
+        numpy.trunc(lat).astype(numpy.int64) & 255,
+        numpy.trunc(lon).astype(numpy.int64) & 255,
+    ), axis=-1).astype(numpy.uint8)
+    pole = (x == 0) & (y == 0)
+    result[pole] = numpy.where(z[pole][:, None] > 0, (0, 0), (128, 0))
+    # numpy trig may land one rounding step away from libm, which only
+    # matters right at a quantization step; redo those few with math
+    edge = ~pole & (near_quantization_edge(lon) | near_quantization_edge(lat))
+    if edge.any():
+        result[edge] = [tuple(encode_normal(v)) for v in n[edge].tolist()]
+    return result
+
+
+def decode_positions(xyz):
+    'Returning float32 positions of int16 xyz records'
+    return numpy.asarray(xyz).astype(numpy.float32) / numpy.float32(VERTEX_SCALE)
+
+
+def decode_triangles(buffer, nTris, offset=0):
+    'Returning (nTris, 3) int32 array of vertex indices, in file winding order'
+    return numpy.frombuffer(buffer, dtype='<i4', count=nTris * 3, offset=offset).reshape(nTris, 3)
+
+
+def decode_texcoords(buffer, nVerts, offset=0):
+    'Returning (nVerts, 2) float32 array of s, t with t flipped like TexCoord does'
+    st = numpy.frombuffer(buffer, dtype='<f4', count=nVerts * 2, offset=offset).reshape(nVerts, 2)
+    uv = st.astype(numpy.float64)
+    uv[:, 1] = texcoord_inverted(uv[:, 1])
+    return uv.astype(numpy.float32)
+
+
+def decode_vertices(buffer, nVerts, nFrames=1, offset=0):
+    'Returning (nFrames, nVerts, 3) float32 arrays of positions and normals'
+    records = numpy.frombuffer(
+        buffer, dtype=VertexRecord, count=nVerts * nFrames, offset=offset,
+    ).reshape(nFrames, nVerts)
+    return decode_positions(records['xyz']), decode_normals(records['normal'])
+
+
+def encode_vertices(co, normals):
+    'Encoding (..., 3) arrays of positions and normals into vertex records'
+    co = numpy.trunc(numpy.asarray(co, dtype=numpy.float64) * VERTEX_SCALE)
+    if co.size and (co.min() < -32768 or co.max() > 32767):
+        raise StructError('short format requires -32768 <= number <= 32767')
+    records = numpy.empty(co.shape[:-1], dtype=VertexRecord)
+    records['xyz'] = co
+    records['normal'] = encode_normals(normals)
+    return records.tobytes()
+
+
 MAGIC = b'IDP3'
 VERSION = 15
+
+# engine limits (qfiles.h)
+MAX_FRAMES = 1024
+MAX_TAGS = 16
+MAX_SURFACES = 32
+MAX_SHADERS = 256
+MAX_VERTS = 4096
+MAX_TRIANGLES = 8192
+
+
+if __name__ == '__main__':
+    import sys
+    from .inspect_md3 import main
+    sys.exit(main())
@@ -5,9 +5,16 @@
 
 import bpy
 import mathutils
+import numpy
 import os.path
+from concurrent.futures import ThreadPoolExecutor
+from struct import error as StructError
 
-from . import fmt_md3 as fmt
+from .md3file import decode_md3
+from .utils import FileIndex, StageTimer, matrix_to_quaternion
+
+
+FRAME_BLOCK = 32  # shape keys added between progress updates
 
 
 def guess_texture_filepath(modelpath, imagepath):
@@ -38,26 +45,37 @@ def get_tag_matrix_basis(data):
     return basis
 
 
+def new_action(id_data, name):
+    action = bpy.data.actions.new(name)
+    id_data.animation_data_create().action = action
+    return action
+
+
+def fill_fcurve(fcurve, frames, values):
+    'Adding keyframes at once instead of keyframe_insert per frame'
+    points = fcurve.keyframe_points
+    points.add(len(frames))
+    points.foreach_set('co', numpy.stack((frames, values), axis=-1).astype(numpy.float32).ravel())
+    fcurve.update()
+
+
 class MD3Importer:
-    def __init__(self, context):
+    def __init__(self, context, import_normals=False, new_scene=True, selection=None, point_cache=False):
         self.context = context
+        self.import_normals = import_normals
+        self.new_scene = new_scene
+        self.selection = selection
+        self.point_cache = point_cache
+        self.timer = StageTimer()
+        self.files = FileIndex()
+        self.images = {}
+        self.materials = {}
 
     @property
     def scene(self):
         return self.context.scene
 
-    def read_n_items(self, n, offset, func):
-        self.file.seek(offset)
-        return [func(i) for i in range(n)]
-
-    def unpack(self, rtype):
-        return rtype.funpack(self.file)
-
-    def read_frame(self, i):
-        return self.unpack(fmt.Frame)
-
-    def create_tag(self, i):
-        data = self.unpack(fmt.Tag)
+    def create_tag(self, data):
         bpy.ops.object.add(type='EMPTY')
         tag = bpy.context.object
         tag.name = data.name
@@ -66,81 +84,96 @@ class MD3Importer:
         tag.matrix_basis = get_tag_matrix_basis(data)
         return tag
 
-    def read_tag_frame(self, i):
-        tag = self.tags[i % self.header.nTags]
-        data = self.unpack(fmt.Tag)
-        tag.matrix_basis = get_tag_matrix_basis(data)
-        frame = i // self.header.nTags
-        tag.keyframe_insert('location', frame=frame, group='LocRot')
-        tag.keyframe_insert('rotation_quaternion', frame=frame, group='LocRot')
-
-    def read_surface_triangle(self, i):
-        data = self.unpack(fmt.Triangle)
-        ls = i * 3
-        self.mesh.loops[ls].vertex_index = data.a
-        self.mesh.loops[ls + 1].vertex_index = data.c  # swapped
-        self.mesh.loops[ls + 2].vertex_index = data.b  # swapped
-        self.mesh.polygons[i].loop_start = ls
-        #self.mesh.polygons[i].loop_total = 3
-        self.mesh.polygons[i].use_smooth = True
-
-    def read_surface_vert(self, i):
-        data = self.unpack(fmt.Vertex)
-        self.verts[i].co = mathutils.Vector((data.x, data.y, data.z))
-        # ignoring data.normal here
-
-    def read_surface_normals(self, i):
-        data = self.unpack(fmt.Vertex)
-        self.mesh.vertices[i].normal = mathutils.Vector(data.normal)
-
-    def read_mesh_animation(self, obj, data, start_pos):
-        obj.shape_key_add(name=self.frames[0].name)  # adding first frame, which is already loaded
-        self.mesh.shape_keys.use_relative = False
+    def read_tag_animation(self, tag_frames):
+        nFrames, nTags = len(self.frames), self.header.nTags
+        locations = numpy.array([t.origin for t in tag_frames]).reshape(nFrames, nTags, 3)
+        # basis rows are axis[j::3], so the stored 3x3 is the transposed basis
+        axes = numpy.array([t.axis for t in tag_frames]).reshape(nFrames, nTags, 3, 3)
+        rotations = matrix_to_quaternion(numpy.swapaxes(axes, -1, -2))
+        frames = numpy.arange(nFrames)
+        for i, tag in enumerate(self.tags):
+            action = new_action(tag, tag.name + 'Action')
+            for path, values in (('location', locations[:, i]), ('rotation_quaternion', rotations[:, i])):
+                for index in range(values.shape[1]):
+                    fcurve = action.fcurves.new(path, index=index, action_group='LocRot')
+                    fill_fcurve(fcurve, frames, values[:, index])
+
+    def read_surface_triangles(self, tris):
+        loops = tris[:, (0, 2, 1)].ravel()  # swapped c/b
+        self.mesh.loops.foreach_set('vertex_index', loops)
+        self.mesh.polygons.foreach_set('loop_start', numpy.arange(0, len(loops), 3, dtype=numpy.int32))
+        self.mesh.polygons.foreach_set('use_smooth', numpy.ones(len(tris), dtype=bool))
+
+    def read_surface_normals(self, normals):
+        # first frame only, shape keys can't carry their own normals
+        self.mesh.normals_split_custom_set_from_vertices(normals)
+
+    def read_mesh_animation(self, obj, co):
+        'Adding a shape key per frame, yielding the count added after each block of frames'
+        with self.timer('animation'):
+            obj.shape_key_add(name=self.frames[0].name)  # adding first frame, which is already loaded
+            self.mesh.shape_keys.use_relative = False
         # TODO: ensure MD3 has linear frame interpolation
-        for frame in range(1, data.nFrames):  # first frame skipped
-            shape_key = obj.shape_key_add(name=self.frames[frame].name)
-            self.verts = shape_key.data
-            self.read_n_items(
-                data.nVerts,
-                start_pos + data.offVerts + frame * fmt.Vertex.size * data.nVerts,
-                self.read_surface_vert)
-        bpy.context.view_layer.objects.active = obj
-        self.context.object.active_shape_key_index = 0
-        bpy.ops.object.shape_key_retime()
-        for frame in range(data.nFrames):
-            self.mesh.shape_keys.eval_time = 10.0 * (frame + 1)
-            self.mesh.shape_keys.keyframe_insert('eval_time', frame=frame)
-
-    def read_surface_ST(self, i):
-        data = self.unpack(fmt.TexCoord)
-        return (data.s, data.t)
+        for start in range(1, len(co), FRAME_BLOCK):  # first frame skipped
+            end = min(start + FRAME_BLOCK, len(co))
+            with self.timer('animation'):
+                for frame in range(start, end):
+                    shape_key = obj.shape_key_add(name=self.frames[frame].name)
+                    shape_key.data.foreach_set('co', co[frame].ravel())
+            yield end - start
+        # eval_time runs through the positions shape_key_add gave the keys,
+        # so scene frame i shows exactly the key of md3 frame i
+        with self.timer('animation'):
+            key_blocks = self.mesh.shape_keys.key_blocks
+            positions = numpy.empty(len(key_blocks), dtype=numpy.float32)
+            key_blocks.foreach_get('frame', positions)
+            fcurve = new_action(self.mesh.shape_keys, obj.name + 'KeyAction').fcurves.new('eval_time')
+            fill_fcurve(fcurve, numpy.arange(len(co)), positions)
+
+    def read_point_cache(self, obj, filepath):
+        # vertex frames stay in the .pc2 file, the mesh only has the first one
+        modifier = obj.modifiers.new('MeshCache', 'MESH_CACHE')
+        modifier.cache_format = 'PC2'
+        modifier.filepath = filepath
+        modifier.frame_start = 0
 
     def make_surface_UV_map(self, uv, uvdata):
-        for poly in self.mesh.polygons:
-            for i in range(poly.loop_start, poly.loop_start + poly.loop_total):
-                vidx = self.mesh.loops[i].vertex_index
-                uvdata[i].uv = uv[vidx]
+        vidx = numpy.empty(len(self.mesh.loops), dtype=numpy.int32)
+        self.mesh.loops.foreach_get('vertex_index', vidx)
+        uvdata.foreach_set('uv', uv[vidx].ravel())
 
-    def read_surface_shader(self, i):
-        data = self.unpack(fmt.Shader)
+    def find_shader_image(self, name):
+        'Returning image for the shader path, each file found is loaded once per import'
+        for fname in guess_texture_filepath(self.filename, name):
+            if '\0' in fname:  # preventing ValueError: embedded null byte
+                continue
+            if self.files.isfile(fname):
+                if fname not in self.images:
+                    self.images[fname] = bpy.data.images.load(fname, check_existing=True)
+                return self.images[fname]
+        return None
 
+    def read_surface_shader(self, i, data):
         shader = self.material.node_tree.nodes["Principled BSDF"]
         texture = self.material.node_tree.nodes.new('ShaderNodeTexImage')
         self.material.node_tree.links.new(shader.inputs['Base Color'], texture.outputs['Color'])
+        texture.image = self.find_shader_image(data.name)
+
+    def read_surface_material(self, shaders):
+        # surfaces sharing shaders share the material, textures are looked up next to the model
+        modeldir = os.path.normcase(os.path.dirname(os.path.abspath(self.filename)))
+        key = (modeldir,) + tuple(shader.name for shader in shaders)
+        self.material = self.materials.get(key)
+        if self.material is None:
+            self.material = self.materials[key] = bpy.data.materials.new('Main')
+            self.material.use_nodes = True
+            for j, shader in enumerate(shaders):
+                self.read_surface_shader(j, shader)
+        self.mesh.materials.append(self.material)
 
-        for fname in guess_texture_filepath(self.filename, data.name):
-            if '\0' in fname:  # preventing ValueError: embedded null byte
-                continue
-            if os.path.isfile(fname):
-                image = bpy.data.images.load(fname)
-                texture.image = image
-                break
-
-    def read_surface(self, i):
-        start_pos = self.file.tell()
-
-        data = self.unpack(fmt.Surface)
-        assert data.magic == b'IDP3'
+    def read_surface(self, i, surface):
+        'Creating the object of a surface, yielding work done like steps() counts it'
+        data = surface.header
         assert data.nFrames == self.header.nFrames
         assert data.nShaders <= 256
         if data.nVerts > 4096:
@@ -148,58 +181,116 @@ class MD3Importer:
         if data.nTris > 8192:
             print('Warning: md3 surface contains too many triangles')
 
-        self.mesh = bpy.data.meshes.new(data.name)
-        self.mesh.vertices.add(count=data.nVerts)
-        self.mesh.polygons.add(count=data.nTris)
-        self.mesh.loops.add(count=data.nTris * 3)
-
-        self.read_n_items(data.nTris, start_pos + data.offTris, self.read_surface_triangle)
-        self.verts = self.mesh.vertices
-        self.read_n_items(data.nVerts, start_pos + data.offVerts, self.read_surface_vert)
-
-        self.mesh.validate()
-
-        self.material = bpy.data.materials.new('Main')
-        self.material.use_nodes = True
-        self.mesh.materials.append(self.material)
-
-        self.mesh.uv_layers.new(name='UVMap')
-        self.make_surface_UV_map(
-            self.read_n_items(data.nVerts, start_pos + data.offST, self.read_surface_ST),
-            self.mesh.uv_layers['UVMap'].data)
-
-        self.read_n_items(data.nShaders, start_pos + data.offShaders, self.read_surface_shader)
-
-        obj = bpy.data.objects.new(data.name, self.mesh)
-        self.scene.collection.objects.link(obj)
-
-        if data.nFrames > 1:
-            self.read_mesh_animation(obj, data, start_pos)
-
-        self.file.seek(start_pos + data.offEnd)
+        with self.timer('triangles'):
+            self.mesh = bpy.data.meshes.new(data.name)
+            self.mesh.vertices.add(count=data.nVerts)
+            self.mesh.polygons.add(count=data.nTris)
+            self.mesh.loops.add(count=data.nTris * 3)
+            self.read_surface_triangles(surface.triangles)
+
+        with self.timer('verts'):
+            self.mesh.vertices.foreach_set('co', surface.co[0].ravel())
+            self.mesh.validate()
+            if self.import_normals:
+                self.read_surface_normals(surface.normals)
+
+        with self.timer('UVs'):
+            self.mesh.uv_layers.new(name='UVMap')
+            self.make_surface_UV_map(surface.uv, self.mesh.uv_layers['UVMap'].data)
+
+        with self.timer('shaders'):
+            self.read_surface_material(surface.shaders)
+
+        with self.timer('objects'):
+            obj = bpy.data.objects.new(data.name, self.mesh)
+            self.scene.collection.objects.link(obj)
+        yield 1
+
+        if surface.pc2 is not None:
+            with self.timer('animation'):
+                self.read_point_cache(obj, surface.pc2)
+        elif len(surface.co) > 1:
+            yield from self.read_mesh_animation(obj, surface.co)
 
     def post_settings(self):
         self.scene.frame_set(0)
 
+    def steps(self, model):
+        '''Creating datablocks of a model returned by decode_md3
+
+        A generator, yielding the fraction done after each surface and each
+        block of shape keys, so the caller can report progress or stop.
+        '''
+        with self.timer('header'):
+            self.filename = model.filename
+            self.files.scan(os.path.dirname(model.filename))
+            self.header = model.header
+            self.frames = model.frames  # only the selected ones, keyed one after another from 0
+
+            if self.new_scene:
+                bpy.ops.scene.new()
+                self.scene.name = self.header.modelname
+                # TODO: start from 1?
+                self.scene.frame_start = 0
+                self.scene.frame_end = len(self.frames) - 1
+            else:
+                self.scene.frame_end = max(self.scene.frame_end, len(self.frames) - 1)
+
+        with self.timer('tags'):
+            self.tags = [self.create_tag(data) for data in model.tag_records[:self.header.nTags]]
+        if len(self.frames) > 1:
+            with self.timer('animation'):
+                self.read_tag_animation(model.tag_records)
+
+        total = sum(1 if s.pc2 is not None else len(s.co) for s in model.surfaces) or 1
+        done = 0
+        for i, surface in enumerate(model.surfaces):
+            for work in self.read_surface(i, surface):
+                done += work
+                yield done / total
+
+        with self.timer('animation'):
+            self.post_settings()
+
+    def build(self, model):
+        'Creating datablocks of a model returned by decode_md3, showing progress'
+        wm = self.context.window_manager
+        wm.progress_begin(0.0, 1.0)
+        try:
+            for progress in self.steps(model):
+                wm.progress_update(progress)
+        finally:
+            wm.progress_end()
+
+    def decode(self, filename):
+        return decode_md3(filename, self.selection, self.point_cache, self.timer)
+
     def __call__(self, filename):
-        self.filename = filename
-        with open(filename, 'rb') as file:
-            self.file = file
-
-            self.header = self.unpack(fmt.Header)
-            assert self.header.magic == fmt.MAGIC
-            assert self.header.version == fmt.VERSION
-
-            bpy.ops.scene.new()
-            self.scene.name = self.header.modelname
-            # TODO: start from 1?
-            self.scene.frame_start = 0
-            self.scene.frame_end = self.header.nFrames - 1
-
-            self.frames = self.read_n_items(self.header.nFrames, self.header.offFrames, self.read_frame)
-            self.tags = self.read_n_items(self.header.nTags, self.header.offTags, self.create_tag)
-            if self.header.nFrames > 1:
-                self.read_n_items(self.header.nTags * self.header.nFrames, self.header.offTags, self.read_tag_frame)
-            self.read_n_items(self.header.nSurfaces, self.header.offSurfaces, self.read_surface)
-
-        self.post_settings()
+        'Importing the file, returning {phase: seconds} of this importer so far'
+        self.build(self.decode(filename))
+        return dict(self.timer.totals)
+
+
+def import_md3_files(context, filenames, workers=None, **options):
+    '''Importing many files into the current scene, returning (filename, error) of failed ones
+
+    Files are decoded in a thread pool, the calling thread only builds
+    datablocks, in the order of filenames, as decoded models become ready.
+    '''
+    importer = MD3Importer(context, new_scene=False, **options)
+    failed = []
+    timers = [StageTimer() for _ in filenames]  # one per thread, merged back here
+    with ThreadPoolExecutor(workers) as pool:
+        futures = [
+            pool.submit(decode_md3, filename, importer.selection, importer.point_cache, timer)
+            for filename, timer in zip(filenames, timers)]
+        for filename, timer, future in zip(filenames, timers, futures):
+            try:
+                model = future.result()
+            except (OSError, ValueError, StructError, AssertionError) as e:
+                failed.append((filename, str(e) or type(e).__name__))
+                continue
+            finally:
+                importer.timer.merge(timer)
+            importer.build(model)
+    return failed
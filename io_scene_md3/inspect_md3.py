@@ -0,0 +1,234 @@
+# Command line checks for .md3 files, no Blender needed:
+#
+#   python -m io_scene_md3.fmt_md3 info model.md3
+#   python -m io_scene_md3.fmt_md3 validate models/
+#   python -m io_scene_md3.fmt_md3 stats models/ another.md3
+
+
+import argparse
+import os
+import sys
+from collections import defaultdict
+from struct import error as StructError
+
+from . import fmt_md3 as fmt
+from .md3file import MD3File, MD3Surface
+from .utils import StageTimer
+
+
+def find_md3_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.lower().endswith('.md3'):
+                        yield os.path.join(dirpath, name)
+        else:
+            yield path
+
+
+def limit_note(value, limit):
+    return '{}/{}{}'.format(value, limit, ' (Too many!)' if value > limit else '')
+
+
+def check_range(problems, what, start, size, end):
+    if start < 0 or start + size > end:
+        problems.append('{} [{}, {}) is outside [0, {})'.format(what, start, start + size, end))
+        return False
+    return True
+
+
+def check_counts(problems, what, record, counts):
+    'Reporting counts below 0, returning True when there are none'
+    ok = True
+    for count in counts:
+        if getattr(record, count) < 0:
+            problems.append('{}{}={} is negative'.format(what, count, getattr(record, count)))
+            ok = False
+    return ok
+
+
+def check_surface(surface, header, problems):
+    h = surface.header
+    what = 'surface {} ({})'.format(surface.index, h.name)
+    if not check_counts(problems, what + ': ', h, ('nFrames', 'nShaders', 'nVerts', 'nTris')):
+        return  # sizes and views of the sections would be nonsense
+    if h.nFrames != header.nFrames:
+        problems.append('{}: nFrames={} while header has {}'.format(what, h.nFrames, header.nFrames))
+    for count, limit in (('nShaders', fmt.MAX_SHADERS), ('nVerts', fmt.MAX_VERTS), ('nTris', fmt.MAX_TRIANGLES)):
+        if getattr(h, count) > limit:
+            problems.append('{}: {}={} exceeds {}'.format(what, count, getattr(h, count), limit))
+    expected = fmt.surface_offsets(h.nShaders, h.nTris, h.nVerts, h.nFrames)
+    sections_ok = True
+    for field, size in (
+            ('offShaders', h.nShaders * fmt.Shader.size),
+            ('offTris', h.nTris * fmt.Triangle.size),
+            ('offST', h.nVerts * fmt.TexCoord.size),
+            ('offVerts', h.nFrames * h.nVerts * fmt.Vertex.size)):
+        sections_ok &= check_range(problems, '{}: {}'.format(what, field), getattr(h, field), size, h.offEnd)
+    if h.offEnd != expected['offEnd']:
+        problems.append('{}: offEnd={} but counts add up to {}'.format(what, h.offEnd, expected['offEnd']))
+    if sections_ok and h.nTris:
+        tris = surface.triangles
+        if tris.min() < 0 or tris.max() >= h.nVerts:
+            problems.append('{}: triangle indices out of [0, {})'.format(what, h.nVerts))
+
+
+def validate(md3, timer):
+    'Returning a list of problems found, empty for a good file'
+    problems = []
+    header = md3.header
+    size = len(md3.view)
+    with timer('header'):
+        if not 1 <= header.nFrames <= fmt.MAX_FRAMES:
+            problems.append('nFrames={} not in [1, {}]'.format(header.nFrames, fmt.MAX_FRAMES))
+        if header.nTags > fmt.MAX_TAGS:
+            problems.append('nTags={} exceeds {}'.format(header.nTags, fmt.MAX_TAGS))
+        if header.nSurfaces > fmt.MAX_SURFACES:
+            problems.append('nSurfaces={} exceeds {}'.format(header.nSurfaces, fmt.MAX_SURFACES))
+        counts_ok = check_counts(problems, '', header, ('nTags', 'nSurfaces'))
+        if header.offEnd != size:
+            problems.append('offEnd={} but file size is {}'.format(header.offEnd, size))
+        frames_ok = check_range(problems, 'frames', header.offFrames, header.nFrames * fmt.Frame.size, size)
+        tags_ok = check_range(problems, 'tags', header.offTags, header.nFrames * header.nTags * fmt.Tag.size, size)
+    if frames_ok:
+        with timer('frames'):
+            md3.frames
+    if tags_ok and counts_ok:
+        with timer('tags'):
+            md3.tag_records
+    with timer('surfaces'):
+        offset = header.offSurfaces
+        for i in range(header.nSurfaces):
+            if not check_range(problems, 'surface {} header'.format(i), offset, fmt.Surface.size, size):
+                break
+            try:
+                surface = MD3Surface(md3, i, offset)
+            except ValueError as e:
+                problems.append(str(e))
+                break
+            if not check_range(problems, 'surface {}'.format(i), offset, surface.header.offEnd, size):
+                break
+            check_surface(surface, header, problems)
+            offset = surface.end
+        else:
+            if offset != header.offEnd:
+                problems.append('surfaces end at {} but offEnd={}'.format(offset, header.offEnd))
+    return problems
+
+
+def open_md3(path, timer):
+    with timer('open'):
+        return MD3File(path)
+
+
+def print_info(path, md3, problems, out):
+    h = md3.header
+    print('{}: {!r} {} bytes'.format(path, h.modelname, len(md3.view)), file=out)
+    print('  nFrames={} nTags={} nSurfaces={} nSkins={}'.format(
+        limit_note(h.nFrames, fmt.MAX_FRAMES), limit_note(h.nTags, fmt.MAX_TAGS),
+        limit_note(h.nSurfaces, fmt.MAX_SURFACES), h.nSkins), file=out)
+    print('  offFrames={} offTags={} offSurfaces={} offEnd={}'.format(
+        h.offFrames, h.offTags, h.offSurfaces, h.offEnd), file=out)
+    if not problems:
+        print('  tags: {}'.format(', '.join(t.name for t in md3.tags(0)) or '-'), file=out)
+        for surface in md3.surfaces:
+            s = surface.header
+            print('  surface {} {!r}: nVerts={} nTris={} nShaders={}'.format(
+                surface.index, s.name, limit_note(s.nVerts, fmt.MAX_VERTS),
+                limit_note(s.nTris, fmt.MAX_TRIANGLES), limit_note(s.nShaders, fmt.MAX_SHADERS)), file=out)
+            for shader in surface.shaders:
+                print('    shader {}: {}'.format(shader.index, shader.name), file=out)
+    print_problems(problems, out)
+
+
+def print_problems(problems, out):
+    if problems:
+        for problem in problems:
+            print('  ERROR: {}'.format(problem), file=out)
+    else:
+        print('  OK', file=out)
+
+
+class Stats:
+    def __init__(self):
+        self.files = 0
+        self.bad_files = 0
+        self.bytes = 0
+        self.totals = defaultdict(int)
+        self.maxima = defaultdict(int)
+
+    def add(self, md3, problems):
+        self.files += 1
+        self.bytes += len(md3.view)
+        if problems:
+            self.bad_files += 1
+            return
+        h = md3.header
+        for name, value in (('frames', h.nFrames), ('tags', h.nTags), ('surfaces', h.nSurfaces)):
+            self.totals[name] += value
+            self.maxima[name] = max(self.maxima[name], value)
+        for surface in md3.surfaces:
+            s = surface.header
+            for name, value in (('verts', s.nVerts), ('tris', s.nTris), ('shaders', s.nShaders)):
+                self.totals[name] += value
+                self.maxima[name] = max(self.maxima[name], value)
+
+    def report(self, seconds, out):
+        print('files={} invalid={} bytes={}'.format(self.files, self.bad_files, self.bytes), file=out)
+        for name in ('frames', 'tags', 'surfaces', 'verts', 'tris', 'shaders'):
+            print('  {:<10} total={:<10} max={}'.format(name, self.totals[name], self.maxima[name]), file=out)
+        if seconds > 0:
+            print('  {:.1f} files/s, {:.1f} MB/s'.format(
+                self.files / seconds, self.bytes / seconds / 2 ** 20), file=out)
+
+
+def main(argv=None, out=sys.stdout):
+    parser = argparse.ArgumentParser(prog='python -m io_scene_md3.fmt_md3', description='Inspect .md3 files')
+    parser.add_argument('command', choices=('info', 'validate', 'stats'))
+    parser.add_argument('paths', nargs='+', help='.md3 files or directories to search recursively')
+    parser.add_argument('-t', '--timing', action='store_true', help='print time spent in each stage')
+    args = parser.parse_args(argv)
+
+    timer = StageTimer()
+    stats = Stats()
+    count = 0
+    failed = 0
+    for path in find_md3_files(args.paths):
+        count += 1
+        try:
+            md3 = open_md3(path, timer)
+        except (OSError, ValueError) as e:
+            failed += 1
+            stats.files += 1
+            stats.bad_files += 1
+            if args.command != 'stats':
+                print('{}:'.format(path), file=out)
+                print_problems([str(e)], out)
+            continue
+        with md3:
+            try:
+                problems = validate(md3, timer)
+            except (StructError, ValueError) as e:
+                problems = [str(e)]
+            failed += bool(problems)
+            if args.command == 'info':
+                with timer('print'):
+                    print_info(path, md3, problems, out)
+            elif args.command == 'validate':
+                if problems:
+                    print('{}:'.format(path), file=out)
+                    print_problems(problems, out)
+            else:
+                with timer('stats'):
+                    stats.add(md3, problems)
+
+    if args.command == 'validate':
+        print('{} of {} files have problems'.format(failed, count), file=out)
+    elif args.command == 'stats':
+        stats.report(sum(timer.totals.values()), out)
+    if args.timing or args.command == 'stats':
+        print('timing:', file=out)
+        timer.report(out)
+    return 1 if failed else 0
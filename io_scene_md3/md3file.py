@@ -0,0 +1,236 @@
+# Reading .md3 files without Blender: the header is parsed on open, the rest
+# is decoded on first access straight from a read-only memory map
+
+
+import mmap
+import os.path
+import re
+from collections import namedtuple
+from functools import cached_property
+from struct import Struct
+
+import numpy
+
+from . import fmt_md3 as fmt
+from .utils import StageTimer
+
+
+def unpack_at(view, rtype, offset):
+    return rtype.unpack(view[offset:offset + rtype.size])
+
+
+class MD3Surface:
+    def __init__(self, md3, index, offset):
+        self.md3 = md3
+        self.index = index
+        self.offset = offset
+        self.header = unpack_at(md3.view, fmt.Surface, offset)
+        if self.header.magic != fmt.MAGIC:
+            raise ValueError('Surface {} has bad magic {!r}'.format(index, self.header.magic))
+
+    @property
+    def name(self):
+        return self.header.name
+
+    @property
+    def nVerts(self):
+        return self.header.nVerts
+
+    @property
+    def nTris(self):
+        return self.header.nTris
+
+    @property
+    def end(self):
+        return self.offset + self.header.offEnd
+
+    def section(self, field):
+        return self.offset + getattr(self.header, field)
+
+    @cached_property
+    def shaders(self):
+        return fmt.Shader.unpack_many(self.md3.view, self.header.nShaders, self.section('offShaders'))
+
+    @cached_property
+    def triangles(self):
+        '(nTris, 3) int32 view, in file winding order'
+        return self.md3.array('<i4', (self.header.nTris, 3), self.section('offTris'))
+
+    @cached_property
+    def texcoords(self):
+        '(nVerts, 2) float32 view of stored s, t (t is not inverted here)'
+        return self.md3.array('<f4', (self.header.nVerts, 2), self.section('offST'))
+
+    @cached_property
+    def vertex_records(self):
+        '(nFrames, nVerts) view of fmt.VertexRecord'
+        return self.md3.array(fmt.VertexRecord, (self.header.nFrames, self.header.nVerts), self.section('offVerts'))
+
+    def vertex_block(self, frame):
+        'Raw bytes of one frame worth of vertices, as a memoryview'
+        size = fmt.Vertex.size * self.header.nVerts
+        start = self.section('offVerts') + frame * size
+        return self.md3.view[start:start + size]
+
+    def vertices(self, frame):
+        'Returning decoded (nVerts, 3) positions and normals of a frame'
+        co, normals = fmt.decode_vertices(self.vertex_block(frame), self.header.nVerts)
+        return co[0], normals[0]
+
+    def positions(self, frames=slice(None)):
+        'Returning decoded (n, nVerts, 3) positions of the frames, without normals'
+        return fmt.decode_positions(self.vertex_records['xyz'][frames])
+
+
+class MD3File:
+    '''Lazy read-only view of an .md3 file
+
+    Arrays and memoryviews handed out point into the mapped file, copy them
+    if they must outlive the MD3File.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mmap)
+        if len(self.view) < fmt.Header.size:
+            self.close()
+            raise ValueError('File is too short to be md3')
+        self.header = unpack_at(self.view, fmt.Header, 0)
+        if self.header.magic != fmt.MAGIC or self.header.version != fmt.VERSION:
+            self.close()
+            raise ValueError('Not an md3 file (magic {!r}, version {})'.format(
+                self.header.magic, self.header.version))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.close()
+        except BufferError:
+            if exc_type is None:
+                raise
+            # frames of the traceback being raised still hold views, don't hide
+            # that error, the mapping goes away once they are gone
+
+    def close(self):
+        '''Dropping the cached arrays and unmapping the file
+
+        Raises BufferError while arrays or memoryviews handed out are alive.
+        '''
+        for surface in self.__dict__.pop('surfaces', ()):
+            for name in ('triangles', 'texcoords', 'vertex_records'):
+                surface.__dict__.pop(name, None)
+        self.view.release()
+        self.mmap.close()
+
+    def array(self, dtype, shape, offset):
+        return numpy.frombuffer(self.mmap, dtype=dtype, count=int(numpy.prod(shape)), offset=offset).reshape(shape)
+
+    @cached_property
+    def frames(self):
+        return fmt.Frame.unpack_many(self.view, self.header.nFrames, self.header.offFrames)
+
+    @cached_property
+    def tag_records(self):
+        return fmt.Tag.unpack_many(self.view, self.header.nFrames * self.header.nTags, self.header.offTags)
+
+    def frame(self, frame):
+        return fmt.Frame.unpack_many(self.view, 1, self.header.offFrames + frame * fmt.Frame.size)[0]
+
+    def tags(self, frame=0):
+        'Returning Tag records of one frame, read from its own block'
+        nTags = self.header.nTags
+        return fmt.Tag.unpack_many(self.view, nTags, self.header.offTags + frame * nTags * fmt.Tag.size)
+
+    @cached_property
+    def surfaces(self):
+        surfaces = []
+        offset = self.header.offSurfaces
+        for i in range(self.header.nSurfaces):
+            surface = MD3Surface(self, i, offset)
+            surfaces.append(surface)
+            offset = surface.end
+        return surfaces
+
+
+# cacheSignature, fileVersion, numPoints, startFrame, sampleRate, numSamples
+PC2Header = Struct('<12siiffi')
+
+
+def pc2_filename(filename, surface):
+    'Returning path of the point cache of a surface, next to the md3 file'
+    base, _ = os.path.splitext(filename)
+    return '{}_{}_{}.pc2'.format(base, surface.index, re.sub(r'[^\w.-]', '_', surface.name))
+
+
+def write_pc2(path, surface, frames=slice(None)):
+    'Writing decoded positions of the frames as a .pc2 point cache, one frame block at a time'
+    with open(path, 'wb') as f:  # opened before any view into the map is taken
+        xyz = surface.vertex_records['xyz']
+        frames = range(len(xyz))[frames] if isinstance(frames, slice) else frames
+        f.write(PC2Header.pack(b'POINTCACHE2', 1, surface.nVerts, 0.0, 1.0, len(frames)))
+        for frame in frames:
+            fmt.decode_positions(xyz[frame]).astype('<f4').tofile(f)
+
+
+DecodedSurface = namedtuple('DecodedSurface', 'header shaders triangles uv co normals pc2')
+DecodedMD3 = namedtuple('DecodedMD3', 'filename header frames tag_records surfaces')
+
+
+def decode_surface(md3, s, frames, first, point_cache, timer):
+    with timer('shaders'):
+        shaders = s.shaders
+    with timer('triangles'):
+        triangles = s.triangles.copy()
+    with timer('UVs'):
+        uv = fmt.decode_texcoords(md3.view, s.nVerts, s.section('offST'))
+    pc2 = None
+    if point_cache:
+        with timer('animation'):
+            pc2 = pc2_filename(md3.filename, s)
+            write_pc2(pc2, s, frames)
+        frames = [first]
+    with timer('verts'):
+        co = s.positions(frames)
+        normals = s.vertices(first)[1]
+    return DecodedSurface(s.header, shaders, triangles, uv, co, normals, pc2)
+
+
+def decode_md3(filename, selection=None, point_cache=False, timer=None):
+    '''Returning everything needed to build the model as records and arrays
+
+    Only Python and numpy work, so it can run in a worker thread. Nothing
+    returned points into the file. co is (nFrames, nVerts, 3), normals are
+    decoded for the first frame only.
+
+    With a FrameSelection only the blocks of the selected frames are read,
+    and frames, tag_records and co hold just those, in selection order.
+    With point_cache and more than one frame, the frames of each surface
+    are written to a .pc2 file next to the md3 instead, and co holds the
+    first one only.
+    Time spent is added to the phases of a StageTimer if one is given.
+    '''
+    timer = StageTimer() if timer is None else timer
+    with timer('header'):
+        md3 = MD3File(filename)
+    with md3:
+        with timer('header'):
+            if selection is None:
+                frames, first = slice(None), 0
+                frame_records = md3.frames
+            else:
+                frames = selection.frames(filename, md3.header.nFrames)
+                first = frames[0]
+                frame_records = [md3.frame(i) for i in frames]
+            # a cache of one frame would only leave a file and a modifier doing nothing
+            point_cache = point_cache and len(frame_records) > 1
+        with timer('tags'):
+            if selection is None:
+                tag_records = md3.tag_records
+            else:
+                tag_records = [tag for i in frames for tag in md3.tags(i)]
+        surfaces = [decode_surface(md3, s, frames, first, point_cache, timer) for s in md3.surfaces]
+        return DecodedMD3(filename, md3.header, frame_records, tag_records, surfaces)
@@ -0,0 +1,207 @@
+import bpy
+import struct
+import os
+import sys
+from time import perf_counter
+from bpy.props import BoolProperty, CollectionProperty, IntProperty, StringProperty
+from bpy_extras.io_utils import ImportHelper, ExportHelper
+
+
+class MD3ImportOptions:
+    '''Properties shared by the md3 import operators'''
+    import_normals: BoolProperty(
+        name="Import Normals",
+        description="Use md3 vertex normals as custom split normals, so re-export keeps the shading",
+        default=False,
+    )
+    point_cache: BoolProperty(
+        name="Point Cache",
+        description="Write vertex animation to .pc2 files next to the model and play it with a Mesh Cache modifier, "
+                    "instead of a shape key per frame",
+        default=False,
+    )
+
+
+class ImportMD3(bpy.types.Operator, ImportHelper, MD3ImportOptions):
+    '''Import a Quake 3 Model MD3 file'''
+    bl_idname = "import_scene.md3"
+    bl_label = 'Import MD3'
+    filename_ext = ".md3"
+    filter_glob = StringProperty(default="*.md3", options={'HIDDEN'})
+    frame_start: IntProperty(name="First Frame", description="First md3 frame to import", default=0, min=0)
+    frame_end: IntProperty(
+        name="Last Frame", description="Last md3 frame to import, -1 for the last one", default=-1, min=-1)
+    frame_step: IntProperty(name="Frame Step", description="Import every Nth frame", default=1, min=1)
+    animations: StringProperty(
+        name="Animations",
+        description="Import only these animations of the animation.cfg next to the file, "
+                    "comma separated (e.g. LEGS_RUN)",
+        default="",
+    )
+    print_timing: BoolProperty(
+        name="Print Timing",
+        description="Print time spent in each import phase to the system console",
+        default=False,
+    )
+    stepwise = False  # set when run from the file browser, not for scripted calls
+
+    def frame_selection(self):
+        from .animation_cfg import FrameSelection
+        names = [name.strip().upper() for name in self.animations.split(',') if name.strip()]
+        if (self.frame_start, self.frame_end, self.frame_step, names) == (0, -1, 1, []):
+            return None
+        return FrameSelection(self.frame_start, self.frame_end, self.frame_step, names)
+
+    def invoke(self, context, event):
+        self.stepwise = True
+        return ImportHelper.invoke(self, context, event)
+
+    def execute(self, context):
+        from .import_md3 import MD3Importer
+        self.importer = MD3Importer(
+            context, import_normals=self.import_normals, selection=self.frame_selection(),
+            point_cache=self.point_cache)
+        try:
+            model = self.importer.decode(self.properties.filepath)
+            if not self.stepwise or context.window is None:  # scripts get the model on return
+                self.importer.build(model)
+                return self.finish()
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        # building runs in steps between timer events, so progress shows and Esc gets through
+        self.steps = self.importer.steps(model)
+        wm = context.window_manager
+        wm.progress_begin(0.0, 1.0)
+        self.event_timer = wm.event_timer_add(0.001, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.stop(context)
+            self.report({'WARNING'}, "Import cancelled, the model is incomplete")
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        self.importer.context = context
+        deadline = perf_counter() + 0.05
+        try:
+            for progress in self.steps:
+                if perf_counter() > deadline:
+                    context.window_manager.progress_update(progress)
+                    return {'RUNNING_MODAL'}
+        except OSError as e:
+            self.stop(context)
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        self.stop(context)
+        return self.finish()
+
+    def stop(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self.event_timer)
+        wm.progress_end()
+
+    def finish(self):
+        timer = self.importer.timer
+        if self.print_timing:
+            print('{}:'.format(self.properties.filepath))
+            timer.report(sys.stdout)
+        self.report({'INFO'}, "Imported in {:.2f} s".format(sum(timer.totals.values())))
+        return {'FINISHED'}
+
+
+class ImportMD3Batch(bpy.types.Operator, ImportHelper, MD3ImportOptions):
+    '''Import many Quake 3 Model MD3 files into the current scene'''
+    bl_idname = "import_scene.md3_batch"
+    bl_label = 'Import MD3 Batch'
+    filename_ext = ".md3"
+    filter_glob = StringProperty(default="*.md3", options={'HIDDEN'})
+    files: CollectionProperty(type=bpy.types.OperatorFileListElement, options={'HIDDEN', 'SKIP_SAVE'})
+    directory: StringProperty(subtype='DIR_PATH')
+    threads: IntProperty(
+        name="Threads",
+        description="Files decoded at once, 0 picks by the number of CPUs",
+        default=0,
+        min=0,
+    )
+
+    def execute(self, context):
+        from .import_md3 import import_md3_files
+        from .inspect_md3 import find_md3_files
+        names = [f.name for f in self.files if f.name]
+        if names:
+            filenames = [os.path.join(self.directory, name) for name in names]
+        else:  # no file picked, the whole directory tree
+            filenames = list(find_md3_files([self.directory]))
+        if not filenames:
+            self.report({'ERROR'}, "No .md3 files found")
+            return {'CANCELLED'}
+        failed = import_md3_files(
+            context, filenames, workers=self.threads or None, import_normals=self.import_normals,
+            point_cache=self.point_cache)
+        for filename, error in failed:
+            self.report({'WARNING'}, "{}: {}".format(filename, error))
+        self.report({'INFO'}, "Imported {} of {} files".format(len(filenames) - len(failed), len(filenames)))
+        return {'FINISHED'}
+
+
+class ExportMD3(bpy.types.Operator, ExportHelper):
+    '''Export a Quake 3 Model MD3 file'''
+    bl_idname = "export_scene.md3"
+    bl_label = 'Export MD3'
+    filename_ext = ".md3"
+    filter_glob = StringProperty(default="*.md3", options={'HIDDEN'})
+    weld_vertices: BoolProperty(
+        name="Weld Vertices",
+        description="Merge vertices that are the same once quantized to md3 precision (int16 position, 8-bit normal)",
+        default=False)
+
+    def execute(self, context):
+        try:
+            from .export_md3 import MD3Exporter
+            exporter = MD3Exporter(context, weld_vertices=self.weld_vertices)
+            exporter(self.properties.filepath)
+            if self.weld_vertices:
+                self.report({'INFO'}, "Welding saved {} vertices".format(exporter.welded))
+            return {'FINISHED'}
+        except struct.error:
+            self.report({'ERROR'}, "Mesh does not fit within the MD3 model space. Vertex axies locations must be below 512 blender units.")
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+        return {'CANCELLED'}
+
+
+def menu_func_import(self, context):
+    self.layout.operator(ImportMD3.bl_idname, text="Quake 3 Model (.md3)")
+
+
+def menu_func_import_batch(self, context):
+    self.layout.operator(ImportMD3Batch.bl_idname, text="Quake 3 Models, batch (.md3)")
+
+
+def menu_func_export(self, context):
+    self.layout.operator(ExportMD3.bl_idname, text="Quake 3 Model (.md3)")
+
+
+classes = (
+    ImportMD3,
+    ImportMD3Batch,
+    ExportMD3,
+)
+
+def register():
+    for cls in classes:
+        bpy.utils.register_class(cls)
+    bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    bpy.types.TOPBAR_MT_file_import.append(menu_func_import_batch)
+    bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
+
+
+def unregister():
+    for cls in classes:
+        bpy.utils.unregister_class(cls)
+    bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    bpy.types.TOPBAR_MT_file_import.remove(menu_func_import_batch)
+    bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
@@ -0,0 +1,272 @@
+# Procedural .md3 files for load and robustness testing, no Blender needed.
+#
+#   python -m io_scene_md3.synth_md3 corpus/            # valid + malformed files
+#   python -m io_scene_md3.synth_md3 corpus/ --quick
+#
+# generate_md3() builds a valid byte stream from parameters, MALFORMATIONS turns
+# one into a deliberately broken variant.
+
+
+import argparse
+import itertools
+import os
+from math import pi
+
+import numpy
+
+from . import fmt_md3 as fmt
+
+
+def make_topology(topology, resolution):
+    '''Returning positions, normals, uvs and triangles of a unit sized mesh
+
+    Vertices on uv seams are duplicated, the same way the exporter splits them.
+    '''
+    rows, cols = resolution
+    u, v = numpy.meshgrid(numpy.linspace(0.0, 1.0, cols + 1), numpy.linspace(0.0, 1.0, rows + 1))
+    u, v = u.ravel(), v.ravel()
+    if topology == 'grid':
+        co = numpy.stack((u - 0.5, v - 0.5, numpy.zeros_like(u)), axis=-1)
+        normals = numpy.tile((0.0, 0.0, 1.0), (len(u), 1))
+    elif topology == 'cylinder':
+        a = u * 2 * pi
+        normals = numpy.stack((numpy.cos(a), numpy.sin(a), numpy.zeros_like(a)), axis=-1)
+        co = normals * 0.5 + numpy.stack((numpy.zeros_like(v),) * 2 + (v - 0.5,), axis=-1)
+    elif topology == 'sphere':
+        a, b = u * 2 * pi, v * pi
+        normals = numpy.stack((numpy.cos(a) * numpy.sin(b), numpy.sin(a) * numpy.sin(b), numpy.cos(b)), axis=-1)
+        co = normals * 0.5
+    else:
+        raise ValueError('Unknown topology {!r}'.format(topology))
+    i = numpy.arange(rows * (cols + 1)).reshape(rows, cols + 1)[:, :cols].ravel()
+    triangles = numpy.concatenate((
+        numpy.stack((i, i + 1, i + cols + 1), axis=-1),
+        numpy.stack((i + 1, i + cols + 2, i + cols + 1), axis=-1),
+    ))
+    return co, normals, numpy.stack((u, v), axis=-1), triangles
+
+
+def animate(co, normals, nFrames, animation, rnd):
+    'Returning (nFrames, nVerts, 3) positions and normals'
+    t = numpy.arange(nFrames)[:, None] / max(nFrames, 1)
+    frames_co = numpy.repeat(co[None], nFrames, axis=0)
+    frames_normals = numpy.repeat(normals[None], nFrames, axis=0)
+    if animation == 'rigid':
+        a = t * 2 * pi
+        c, s = numpy.cos(a), numpy.sin(a)
+        for arr in (frames_co, frames_normals):
+            x, y = arr[..., 0].copy(), arr[..., 1].copy()
+            arr[..., 0] = c * x - s * y
+            arr[..., 1] = s * x + c * y
+        frames_co[..., 2] += 0.1 * numpy.sin(a)
+    elif animation == 'wave':
+        frames_co[..., 2] += 0.1 * numpy.sin((co[None, :, 0] + t) * 4 * pi)
+    elif animation == 'noise':
+        frames_co += rnd.uniform(-0.02, 0.02, frames_co.shape)
+    elif animation != 'static':
+        raise ValueError('Unknown animation {!r}'.format(animation))
+    return frames_co, frames_normals
+
+
+def tag_frames(names, nFrames, tag_motion, radius):
+    'Returning Tag records, nFrames groups of len(names)'
+    records = []
+    for frame in range(nFrames):
+        a = frame / max(nFrames, 1) * 2 * pi
+        for i, name in enumerate(names):
+            origin = (0.0, 0.0, radius * (i + 1) / len(names))
+            if tag_motion == 'orbit':
+                origin = (radius * numpy.cos(a + i), radius * numpy.sin(a + i), origin[2])
+            elif tag_motion == 'bob':
+                origin = (0.0, 0.0, origin[2] + 0.1 * radius * numpy.sin(a))
+            elif tag_motion != 'static':
+                raise ValueError('Unknown tag motion {!r}'.format(tag_motion))
+            c, s = numpy.cos(a), numpy.sin(a)
+            if tag_motion == 'orbit':
+                axis = (c, s, 0.0, -s, c, 0.0, 0.0, 0.0, 1.0)
+            else:
+                axis = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)
+            records.append((name, tuple(map(float, origin)), tuple(map(float, axis))))
+    return records
+
+
+def pack_surface(name, shaders, co, normals, uv, triangles):
+    nFrames, nVerts = co.shape[:2]
+    offsets = fmt.surface_offsets(len(shaders), len(triangles), nVerts, nFrames)
+    return b''.join((
+        fmt.Surface.pack(
+            magic=fmt.MAGIC, name=name, flags=0, nFrames=nFrames, nShaders=len(shaders),
+            nVerts=nVerts, nTris=len(triangles), **offsets),
+        fmt.Shader.pack_many([(shader, i) for i, shader in enumerate(shaders)]),
+        triangles.astype('<i4').tobytes(),
+        fmt.TexCoord.pack_many(uv.tolist()),
+        fmt.encode_vertices(co, normals),
+    ))
+
+
+def frame_records(all_co, nFrames):
+    records = []
+    for frame in range(nFrames):
+        co = numpy.concatenate([c[frame] for c in all_co]) if all_co else numpy.zeros((1, 3))
+        co = numpy.trunc(co * fmt.VERTEX_SCALE) / fmt.VERTEX_SCALE
+        center = (co.min(axis=0) + co.max(axis=0)) / 2
+        records.append((
+            tuple(co.min(axis=0).tolist()), tuple(co.max(axis=0).tolist()), (0.0, 0.0, 0.0),
+            float(numpy.sqrt(((co - center) ** 2).sum(axis=1).max())), 'frame{}'.format(frame)))
+    return records
+
+
+def generate_md3(
+        nFrames=1, surfaces=1, topology='grid', resolution=(8, 8), animation='wave',
+        tags=('tag_head', 'tag_weapon'), tag_motion='orbit',
+        shaders=('models/synth/skin',), modelname='synth', size=64.0, seed=0):
+    'Returning bytes of a valid md3 file built from the parameters'
+    rnd = numpy.random.RandomState(seed)
+    surfaces_bin = []
+    all_co = []
+    for s in range(surfaces):
+        co, normals, uv, triangles = make_topology(topology, resolution)
+        co = co * size + (0.0, 0.0, s * size * 0.25)
+        co, normals = animate(co, normals, nFrames, animation, rnd)
+        all_co.append(co)
+        surfaces_bin.append(pack_surface('surface{}'.format(s), shaders, co, normals, uv, triangles))
+    tag_records = tag_frames(tags, nFrames, tag_motion, size)
+    frames = fmt.Frame.pack_many(frame_records(all_co, nFrames))
+    surfaces_data = b''.join(surfaces_bin)
+    return b''.join((
+        fmt.Header.pack(
+            magic=fmt.MAGIC, version=fmt.VERSION, modelname=modelname, flags=0,
+            nFrames=nFrames, nTags=len(tags), nSurfaces=surfaces, nSkins=0,
+            **fmt.header_offsets(nFrames, len(tags), len(surfaces_data))),
+        frames,
+        fmt.Tag.pack_many(tag_records),
+        surfaces_data,
+    ))
+
+
+# Breaking valid files on purpose
+
+def replace_field(data, rtype, offset, **fields):
+    record = rtype.unpack(data[offset:offset + rtype.size])._replace(**fields)
+    return data[:offset] + rtype.pack(*record) + data[offset + rtype.size:]
+
+
+def first_surface(data):
+    return fmt.Header.unpack(data[:fmt.Header.size]).offSurfaces
+
+
+def truncated(data, rnd):
+    return data[:rnd.randint(1, len(data))]
+
+
+def bad_magic(data, rnd):
+    return replace_field(data, fmt.Header, 0, magic=b'IDP2')
+
+
+def bad_version(data, rnd):
+    return replace_field(data, fmt.Header, 0, version=fmt.VERSION + 1)
+
+
+def surfaces_past_end(data, rnd):
+    return replace_field(data, fmt.Header, 0, offSurfaces=len(data) + rnd.randint(1, 1 << 16))
+
+
+def negative_offset(data, rnd):
+    return replace_field(data, fmt.Header, 0, offTags=-rnd.randint(1, 1 << 16))
+
+
+def oversized_counts(data, rnd):
+    return replace_field(data, fmt.Header, 0, nFrames=1 << 20, nTags=1 << 10)
+
+
+def surface_bad_magic(data, rnd):
+    return replace_field(data, fmt.Surface, first_surface(data), magic=b'\0\0\0\0')
+
+
+def surface_past_end(data, rnd):
+    return replace_field(data, fmt.Surface, first_surface(data), offVerts=len(data), offEnd=len(data) * 2)
+
+
+def surface_oversized_counts(data, rnd):
+    return replace_field(data, fmt.Surface, first_surface(data), nVerts=1 << 20, nTris=1 << 20)
+
+
+def surface_negative_counts(data, rnd):
+    return replace_field(data, fmt.Surface, first_surface(data), nVerts=-rnd.randint(1, 1000), nTris=-1)
+
+
+def triangle_out_of_range(data, rnd):
+    start = first_surface(data)
+    surface = fmt.Surface.unpack(data[start:start + fmt.Surface.size])
+    return replace_field(data, fmt.Triangle, start + surface.offTris, a=surface.nVerts + rnd.randint(0, 1000))
+
+
+MALFORMATIONS = {
+    'truncated': truncated,
+    'bad_magic': bad_magic,
+    'bad_version': bad_version,
+    'surfaces_past_end': surfaces_past_end,
+    'negative_offset': negative_offset,
+    'oversized_counts': oversized_counts,
+    'surface_bad_magic': surface_bad_magic,
+    'surface_past_end': surface_past_end,
+    'surface_oversized_counts': surface_oversized_counts,
+    'surface_negative_counts': surface_negative_counts,
+    'triangle_out_of_range': triangle_out_of_range,
+}
+
+
+def malform(data, kind, seed=0):
+    return MALFORMATIONS[kind](data, numpy.random.RandomState(seed))
+
+
+FULL_GRID = {
+    'nFrames': (1, 30, 200),
+    'surfaces': (1, 4),
+    'resolution': ((4, 4), (20, 20), (40, 50)),
+    'animation': ('rigid', 'wave', 'noise'),
+}
+
+QUICK_GRID = {
+    'nFrames': (1, 10),
+    'surfaces': (1, 2),
+    'resolution': ((4, 4),),
+    'animation': ('wave',),
+}
+
+
+def build_corpus(directory, grid=FULL_GRID, malformed=True, seed=0):
+    'Writing valid files over the grid and malformed variants of them, returning paths'
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    keys = sorted(grid)
+    for n, values in enumerate(itertools.product(*(grid[k] for k in keys))):
+        params = dict(zip(keys, values))
+        data = generate_md3(seed=seed + n, **params)
+        base = 'f{nFrames}_s{surfaces}_r{resolution[0]}x{resolution[1]}_{animation}'.format(**params)
+        variants = [('', data)]
+        if malformed:
+            variants.extend(
+                ('.' + kind, malform(data, kind, seed + n)) for kind in sorted(MALFORMATIONS))
+        for suffix, content in variants:
+            path = os.path.join(directory, base + suffix + '.md3')
+            with open(path, 'wb') as f:
+                f.write(content)
+            paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m io_scene_md3.synth_md3', description='Build a corpus of synthetic md3 files')
+    parser.add_argument('directory')
+    parser.add_argument('--quick', action='store_true', help='small grid')
+    parser.add_argument('--valid-only', action='store_true', help='skip malformed variants')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    paths = build_corpus(args.directory, QUICK_GRID if args.quick else FULL_GRID, not args.valid_only, args.seed)
+    print('{} files written to {}'.format(len(paths), args.directory))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,11 @@
-from struct import Struct
-from collections import namedtuple
+from struct import Struct, error as StructError
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
 from io import BytesIO
+from time import perf_counter
+import os
+
+import numpy
 
 
 def get_index_of_tuples(ts, index, default):
@@ -11,6 +16,85 @@ def noop(value):
     return value
 
 
+def matrix_to_quaternion(m):
+    '''Converting (..., 3, 3) rotation matrices to (..., 4) w, x, y, z quaternions
+
+    Same branches as Blender's mat3_normalized_to_quat, w is kept positive.
+    Columns are normalized first, so scaled matrices are accepted.
+    '''
+    m = numpy.asarray(m, dtype=numpy.float64)
+    m = m / numpy.linalg.norm(m, axis=-2, keepdims=True)
+    m00, m01, m02 = m[..., 0, 0], m[..., 0, 1], m[..., 0, 2]
+    m10, m11, m12 = m[..., 1, 0], m[..., 1, 1], m[..., 1, 2]
+    m20, m21, m22 = m[..., 2, 0], m[..., 2, 1], m[..., 2, 2]
+    trace = m00 + m11 + m22
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        candidates = []
+        s = 2.0 * numpy.sqrt(1.0 + trace)
+        candidates.append((0.25 * s, (m21 - m12) / s, (m02 - m20) / s, (m10 - m01) / s))
+        s = 2.0 * numpy.sqrt(1.0 + m00 - m11 - m22)
+        candidates.append(((m21 - m12) / s, 0.25 * s, (m01 + m10) / s, (m02 + m20) / s))
+        s = 2.0 * numpy.sqrt(1.0 + m11 - m00 - m22)
+        candidates.append(((m02 - m20) / s, (m01 + m10) / s, 0.25 * s, (m12 + m21) / s))
+        s = 2.0 * numpy.sqrt(1.0 + m22 - m00 - m11)
+        candidates.append(((m10 - m01) / s, (m02 + m20) / s, (m12 + m21) / s, 0.25 * s))
+    branch = numpy.where(trace > 0, 0, numpy.where((m00 > m11) & (m00 > m22), 1, numpy.where(m11 > m22, 2, 3)))
+    q = numpy.choose(branch[..., None], [numpy.stack(c, axis=-1) for c in candidates])
+    q = numpy.where(q[..., :1] < 0, -q, q)
+    return q / numpy.linalg.norm(q, axis=-1, keepdims=True)
+
+
+def first_occurrences(keys):
+    '''Returning index of the first row of every distinct row and row -> distinct index
+
+    Distinct rows are numbered in order of their first appearance.
+    '''
+    _, first, inverse = numpy.unique(keys, axis=0, return_index=True, return_inverse=True)
+    order = numpy.argsort(first)
+    rank = numpy.empty_like(order)
+    rank[order] = numpy.arange(len(order))
+    return first[order], rank[inverse.ravel()]
+
+
+def float_columns(values, width):
+    # + 0.0 folds -0.0 into 0.0, which compare equal as floats but not as bits
+    values = numpy.asarray(values, dtype=numpy.float32).reshape(-1, width) + numpy.float32(0.0)
+    return values.view(numpy.uint32)
+
+
+def unique_loops(vertex_index, normals, uv=None):
+    '''Returning md3vert -> loop and loop -> md3vert index arrays
+
+    Loops sharing vertex, normal and uv become one md3 vertex, numbered in
+    order of their first loop, same as a dict over (vertex, normal, uv) keys.
+    '''
+    columns = [numpy.asarray(vertex_index, dtype=numpy.int32)[:, None].view(numpy.uint32)]
+    for values, width in ((normals, 3), (uv, 2)):
+        if values is not None:
+            columns.append(float_columns(values, width))
+    return first_occurrences(numpy.ascontiguousarray(numpy.concatenate(columns, axis=1)))
+
+
+def weld_loops(records, uv=None, vertex_index=None):
+    '''Returning md3vert -> loop and loop -> md3vert index arrays
+
+    Loops are compared by what ends up in the file: (nLoops, n) uint8 rows
+    of encoded vertex records or normals, and float32 uv. Without
+    vertex_index loops of different vertices may become one md3 vertex.
+    '''
+    columns = [numpy.asarray(records, dtype=numpy.uint8)]
+    if uv is not None:
+        columns.append(float_columns(uv, 2).view(numpy.uint8))
+    if vertex_index is not None:
+        columns.append(numpy.asarray(vertex_index, dtype=numpy.int32)[:, None].view(numpy.uint8))
+    return first_occurrences(numpy.ascontiguousarray(numpy.concatenate(columns, axis=1)))
+
+
+def compile_function(source, name, namespace):
+    exec(compile(source, '<{}>'.format(name), 'exec'), namespace)
+    return namespace[name]
+
+
 class AnyStruct:
     def __init__(self, name, fields):
         self.ntuple_cls = namedtuple(name, [f[0] for f in fields])
@@ -18,38 +102,92 @@ class AnyStruct:
         self.tupling = get_index_of_tuples(fields, 2, 1)
         self.frombin = get_index_of_tuples(fields, 3, noop)
         self.tobin = get_index_of_tuples(fields, 4, noop)
+        self.unpack = self.compile_unpack()
+        self.pack = self.compile_pack()
 
     @property
     def size(self):
         return self.struct.size
 
-    def unpack(self, bs):
-        pt = self.struct.unpack(bs)
-        t = []
-        pti = iter(pt)
-        for sz, conv_func in zip(self.tupling, self.frombin):
+    def compile_unpack(self):
+        # field layout is fixed, so generate flat functions once, e.g.
+        # return _new(_cls, (_f0(v[0]), v[1:4], ...))
+        namespace = {
+            '_unpack': self.struct.unpack,
+            '_new': tuple.__new__,
+            '_cls': self.ntuple_cls,
+        }
+        items = []
+        pos = 0
+        for i, (sz, conv_func) in enumerate(zip(self.tupling, self.frombin)):
             if sz == 1:
-                value = next(pti)
+                expr = 'v[{}]'.format(pos)
             else:
-                value = tuple(next(pti) for i in range(sz))
-            t.append(conv_func(value))
-        return self.ntuple_cls._make(t)
+                expr = 'v[{}:{}]'.format(pos, pos + sz)
+            if conv_func is not noop:
+                namespace['_f{}'.format(i)] = conv_func
+                expr = '_f{}({})'.format(i, expr)
+            items.append(expr)
+            pos += sz
+        source = (
+            'def convert(v):\n'
+            '    return _new(_cls, ({0},))\n'
+            'def unpack(bs):\n'
+            '    v = _unpack(bs)\n'
+            '    return _new(_cls, ({0},))\n'
+        ).format(', '.join(items))
+        self.convert = compile_function(source, 'convert', namespace)
+        return namespace['unpack']
+
+    def compile_pack(self):
+        # keyword/positional arguments are the field names, just like the
+        # namedtuple constructor, so no tuple has to be built per call
+        namespace = {
+            '_pack': self.struct.pack,
+            '_pack_into': self.struct.pack_into,
+        }
+        fields = self.ntuple_cls._fields
+        lines = []
+        items = []
+        for i, (field, sz, conv_func) in enumerate(zip(fields, self.tupling, self.tobin)):
+            expr = field
+            if conv_func is not noop:
+                namespace['_f{}'.format(i)] = conv_func
+                expr = '_f{}({})'.format(i, expr)
+            if sz != 1:
+                lines.append('    {} = {}\n'.format(field, expr))
+                lines.append('    assert len({}) == {}\n'.format(field, sz))
+                expr = '*' + field
+            items.append(expr)
+        source = (
+            'def pack({0}):\n{1}'
+            '    return _pack({2})\n'
+            'def pack_into(_buffer, _offset, {0}):\n{1}'
+            '    _pack_into(_buffer, _offset, {2})\n'
+        ).format(', '.join(fields), ''.join(lines), ', '.join(items))
+        self.pack_into = compile_function(source, 'pack_into', namespace)
+        return namespace['pack']
+
+    def unpack_many(self, buffer, count, offset=0):
+        'Unpacking count consecutive records from a bytes-like object'
+        size = count * self.size
+        if offset < 0 or count < 0 or offset + size > memoryview(buffer).nbytes:
+            raise StructError('unpack_many requires a buffer of {} bytes'.format(size))
+        with memoryview(buffer) as view:
+            return list(map(self.convert, self.struct.iter_unpack(view[offset:offset + size])))
+
+    def pack_many(self, records):
+        'Packing a sequence of records (tuples of field values) back to back'
+        size = self.size
+        pack_into = self.pack_into
+        buffer = bytearray(len(records) * size)
+        for i, record in enumerate(records):
+            pack_into(buffer, i * size, *record)
+        return bytes(buffer)
 
     def funpack(self, f):
         return self.unpack(f.read(self.size))
 
-    def pack(self, *a, **kw):
-        t = self.ntuple_cls(*a, **kw)
-        pt = []
-        for value, sz, conv_func in zip(t, self.tupling, self.tobin):
-            value = conv_func(value)
-            if sz == 1:
-                pt.append(value)
-            else:
-                assert len(value) == sz
-                pt.extend(value)
-        return self.struct.pack(*pt)
-
     def fpack(self, f, *a, **kw):
         return f.write(self.pack(*a, **kw))
 
@@ -71,3 +209,134 @@ class OffsetBytesIO:
 
     def getoffsets(self):
         return self.offsets.copy()
+
+
+class SizedOffsetBytesIO:
+    'OffsetBytesIO over a buffer reserved up front, records are packed in place'
+
+    def __init__(self, size, start_offset=0):
+        self.shift = start_offset
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.pos = 0
+        self.offsets = {}
+
+    def mark(self, name):
+        self.offsets[name] = self.pos + self.shift
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos):
+        self.pos = pos
+
+    def write(self, data):
+        end = self.pos + len(data)
+        self.view[self.pos:end] = data  # raises instead of growing past the reserved size
+        self.pos = end
+
+    def pack(self, rtype, *a, **kw):
+        rtype.pack_into(self.buffer, self.pos, *a, **kw)
+        self.pos += rtype.size
+
+    def getvalue(self):
+        return self.view[:self.pos]
+
+    def getoffsets(self):
+        return self.offsets.copy()
+
+
+class FileIndex:
+    '''Answering isfile() from directory listings read once
+
+    scan() fills the index for a whole tree, directories outside of it are
+    listed on first lookup. Paths are compared normcased.
+    '''
+
+    def __init__(self):
+        self.dirs = {}
+        self.roots = set()
+
+    def scan(self, root):
+        root = os.path.normcase(os.path.normpath(root or os.curdir))
+        if root in self.roots:
+            return
+        self.roots.add(root)
+        for dirpath, _, filenames in os.walk(root):
+            self.dirs[os.path.normcase(os.path.normpath(dirpath))] = {os.path.normcase(f) for f in filenames}
+
+    def listdir(self, dirpath):
+        try:
+            with os.scandir(dirpath) as entries:
+                return {os.path.normcase(e.name) for e in entries if e.is_file()}
+        except (OSError, ValueError):
+            return set()
+
+    def isfile(self, path):
+        dirpath, name = os.path.split(os.path.normcase(os.path.normpath(path)))
+        dirpath = dirpath or os.curdir
+        names = self.dirs.get(dirpath)
+        if names is None:
+            names = self.dirs[dirpath] = self.listdir(dirpath)
+        return name in names
+
+
+class FrameBounds:
+    '''Bounds, centroid and radius of every frame, fed with vertex arrays
+
+    Arrays are added frame after frame, a surface at a time. Only the
+    vertices of the frame being added are kept, earlier frames are reduced
+    to their bounds. Frames without vertices have zero bounds.
+    '''
+
+    def __init__(self, nFrames):
+        self.lower = numpy.zeros((nFrames, 3))
+        self.upper = numpy.zeros((nFrames, 3))
+        self.center = numpy.zeros((nFrames, 3))
+        self.radius = numpy.zeros(nFrames)
+        self.frame = None
+        self.pending = []
+
+    def add(self, frame, co):
+        if frame != self.frame:
+            self.flush()
+            self.frame = frame
+        self.pending.append(numpy.asarray(co, dtype=numpy.float64).reshape(-1, 3))
+
+    def flush(self):
+        co = numpy.concatenate(self.pending) if self.pending else ()
+        if len(co):
+            i = self.frame
+            self.lower[i] = co.min(axis=0)
+            self.upper[i] = co.max(axis=0)
+            self.center[i] = co.mean(axis=0)
+            self.radius[i] = numpy.sqrt(((co - self.center[i]) ** 2).sum(axis=1).max())
+        self.pending = []
+
+    def __getitem__(self, i):
+        'Returning lower, upper bounds and radius around the centroid of frame i'
+        self.flush()
+        return self.lower[i], self.upper[i], float(self.radius[i])
+
+
+class StageTimer:
+    def __init__(self):
+        self.totals = defaultdict(float)
+
+    @contextmanager
+    def __call__(self, stage):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[stage] += perf_counter() - start
+
+    def merge(self, other):
+        for stage, seconds in other.totals.items():
+            self.totals[stage] += seconds
+
+    def report(self, out):
+        total = sum(self.totals.values())
+        for stage, seconds in self.totals.items():
+            print('  {:<10} {:9.3f} ms'.format(stage, seconds * 1000), file=out)
+        print('  {:<10} {:9.3f} ms'.format('total', total * 1000), file=out)
@@ -26,6 +26,9 @@ class Q3AnimationConfigProperties(bpy.types.PropertyGroup):
     anim_cfg_enabled: bpy.props.BoolProperty(name="Animation Config", default=True, description="Generate animation.cfg on export")
     skin_enabled: bpy.props.BoolProperty(name="Skin Config", default=True, description="Generate .skin file templates on export")
     scale_multiplier: bpy.props.IntProperty(name="Model Scale", default=10, description="Scale up model by a multiplier")
+    weld_vertices: bpy.props.BoolProperty(
+        name="Weld Vertices", default=False,
+        description="Merge vertices that are the same once quantized to md3 precision (int16 position, 8-bit normal)")
     sex_defined: bpy.props.EnumProperty(
         items=[
             ("sex n", "Neutral", ""),
@@ -71,6 +74,8 @@ class Q3AnimationConfigPanel(bpy.types.Panel):
         row.prop(q3_props, "modeltype")
         row = layout.row()
         row.prop(q3_props, "scale_multiplier", text="Scale")
+        row = layout.row()
+        row.prop(q3_props, "weld_vertices", toggle=False)
         if not q3_props.modeltype == "static":
             row = layout.row()
             row.prop(q3_props, "selected_object", text="Target")
@@ -4,15 +4,14 @@
 #line 158 "return co" modified to "return co * 10" 
 #line 337 added static variable
 
+import os
 import re
-from collections import defaultdict
-from math import sqrt
 
 import bpy
-import mathutils
+import numpy
 import bmesh
 from . import fmt_md3 as fmt
-from .utils import OffsetBytesIO
+from .utils import FrameBounds, SizedOffsetBytesIO, unique_loops, weld_loops
 
 nums = re.compile(r'\.\d{3}$')
 
@@ -55,28 +54,42 @@ def gather_shader_info(mesh):
         print('Warning: Multiple UV maps found, only one will be chosen')
         return uv_maps.active.name, materials[0]
 
-def gather_vertices(mesh, uvmap_data=None):
-    md3vert_to_loop_map = []
-    loop_to_md3vert_map = []
-    index = {}
-    for i, loop in enumerate(mesh.loops):
-        key = (
-            loop.vertex_index,
-            tuple(loop.normal),
-            None if uvmap_data is None else tuple(uvmap_data[i].uv),
-        )
-        md3id = index.get(key, None)
-        if md3id is None:
-            md3id = len(md3vert_to_loop_map)
-            index[key] = md3id
-            md3vert_to_loop_map.append(i)
-        loop_to_md3vert_map.append(md3id)
+def gather_vertices(mesh, uvmap_data=None, weld=False, co=None):
+    '''Returning md3vert -> loop and loop -> md3vert index arrays
+
+    With weld, loops of a vertex are compared by their quantized normal
+    instead of the exact one. Given co too, the positions of the mesh
+    vertices in the only exported frame, loops of different vertices are
+    welded by their whole md3 vertex.
+    '''
+    loops = mesh.loops
+    vertex_index = numpy.empty(len(loops), dtype=numpy.int32)
+    loops.foreach_get('vertex_index', vertex_index)
+    normals = numpy.empty(len(loops) * 3, dtype=numpy.float32)
+    loops.foreach_get('normal', normals)
+    uv = None
+    if uvmap_data is not None:
+        uv = numpy.empty(len(uvmap_data) * 2, dtype=numpy.float32)
+        uvmap_data.foreach_get('uv', uv)
+    if weld and co is not None:
+        records = fmt.encode_vertices(co[vertex_index], normals.reshape(-1, 3))
+        return weld_loops(numpy.frombuffer(records, dtype=numpy.uint8).reshape(len(loops), -1), uv)
+    if weld:
+        # vertices that meet in one frame may part in another, so only loops of a vertex are welded
+        return weld_loops(fmt.encode_normals(normals.reshape(-1, 3)), uv, vertex_index)
+    return unique_loops(vertex_index, normals, uv)
 
-    return md3vert_to_loop_map, loop_to_md3vert_map
 
 def interp(a, b, t):
     return (b - a) * t + a
 
+
+def get_co_array(collection):
+    'Returning (n, 3) float64 array of co of mesh vertices or shape key points'
+    co = numpy.empty(len(collection) * 3, dtype=numpy.float32)
+    collection.foreach_get('co', co)
+    return co.reshape(-1, 3).astype(numpy.float64)
+
 def find_interval(vs, t):
     a, b = 0, len(vs) - 1
     if t < vs[a]:
@@ -92,9 +105,24 @@ def find_interval(vs, t):
     assert vs[a] <= t <= vs[b]
     return a, b
 
+class SurfaceCapture:
+    'A surface packed up to its vertices, which are written to the file frame by frame'
+
+    def __init__(self, obj, head, md3vert_to_loop, size):
+        self.obj = obj
+        self.head = head
+        self.md3vert_to_loop = md3vert_to_loop
+        self.size = size
+        self.offset = 0  # in the file, known once all surfaces are prepared
+
+    def vertices_offset(self, frame):
+        return self.offset + len(self.head) + frame * len(self.md3vert_to_loop) * fmt.Vertex.size
+
+
 class MD3Exporter:
     def __init__(self, context):
         self.context = context
+        self.welded = 0
 
     @property
     def scene(self):
@@ -108,30 +136,28 @@ class MD3Exporter:
     def modeltype(self):
         return self.context.scene.q3_animation_config.modeltype
 
-    def pack_tag(self, name):
+    @property
+    def weld_vertices(self):
+        return self.context.scene.q3_animation_config.weld_vertices
+
+    def pack_tag(self, f, name):
         tag = self.scene.objects[name]
         m = tag.matrix_basis.transposed()
-        return fmt.Tag.pack(
+        f.pack(
+            fmt.Tag,
             name=prepare_name(tag.name),
             origin=tuple(tag.location),
             axis=sum([tuple(m[j].xyz) for j in range(3)], ()),
         )
 
-    def pack_animated_tags(self):
-        tags_bin = []
-        for frame in range(self.nFrames):
-            self.switch_frame(frame)
-            for name in self.tagNames:
-                tags_bin.append(self.pack_tag(name))
-        return b''.join(tags_bin)
-
-    def pack_surface_shader(self, i):
-        return fmt.Shader.pack(
+    def pack_surface_shader(self, f, i):
+        f.pack(
+            fmt.Shader,
             name=prepare_name(self.mesh_shader_list),
             index=i,
         )
 
-    def pack_surface_triangle(self, i):
+    def pack_surface_triangle(self, f, i):
         polygon = self.mesh.polygons[i]
         print(f"Polygon {i} has {polygon.loop_total} loops")
         if polygon.loop_total != 3:
@@ -142,45 +168,53 @@ class MD3Exporter:
         assert self.mesh.polygons[i].loop_total == 3
         start = self.mesh.polygons[i].loop_start
         a, b, c = (self.mesh_loop_to_md3vert[j] for j in range(start, start + 3))
-        return fmt.Triangle.pack(a, c, b)  # swapped c/b
+        f.pack(fmt.Triangle, a, c, b)  # swapped c/b
 
-    def get_evaluated_vertex_co(self, frame, i):
-        co = self.mesh.vertices[i].co.copy()
+    def get_evaluated_vertex_co(self):
+        'Returning (nVerts, 3) positions of the mesh at the current frame, in world space'
+        co = get_co_array(self.mesh.vertices)
 
         if self.mesh_sk_rel is not None:
             bco = co.copy()
             for ki, k in enumerate(self.mesh.shape_keys.key_blocks):
-                co += (k.data[i].co - bco) * self.mesh_sk_rel[ki]
+                co += (get_co_array(k.data) - bco) * self.mesh_sk_rel[ki]
         elif self.mesh_sk_abs is not None:
             kbs = self.mesh.shape_keys.key_blocks
             a, b, t = self.mesh_sk_abs
-            co = interp(kbs[a].data[i].co, kbs[b].data[i].co, t)
-
-        co = self.mesh_matrix @ co
-        self.mesh_vco[frame].append(co)
-        return co * self.scale_multiplier
-
-    def pack_surface_vert(self, frame, i):
-        loop_id = self.mesh_md3vert_to_loop[i]
-        vert_id = self.mesh.loops[loop_id].vertex_index
-        return fmt.Vertex.pack(
-            *self.get_evaluated_vertex_co(frame, vert_id),
-            normal=tuple(self.mesh.loops[loop_id].normal))
-
-    def pack_surface_ST(self, i):
+            co = interp(get_co_array(kbs[a].data), get_co_array(kbs[b].data), t)
+
+        return self.to_export_space(co)
+
+    def to_export_space(self, co):
+        'Returning (n, 3) positions of mesh_matrix applied to co'
+        m = numpy.array(self.mesh_matrix)[:3] * self.scale_multiplier  # scale and world matrix in one product
+        return co @ m[:, :3].T + m[:, 3]
+
+    def write_surface_verts(self, f, frame):
+        'Writing the md3 vertices of a frame, gathered from loops with index arrays'
+        loops = self.mesh.loops
+        vertex_index = numpy.empty(len(loops), dtype=numpy.int32)
+        loops.foreach_get('vertex_index', vertex_index)
+        normals = numpy.empty(len(loops) * 3, dtype=numpy.float32)
+        loops.foreach_get('normal', normals)
+        md3loops = numpy.asarray(self.mesh_md3vert_to_loop, dtype=numpy.intp)
+        co = self.get_evaluated_vertex_co()[vertex_index[md3loops]]
+        self.bounds.add(frame, co)
+        f.write(fmt.encode_vertices(co, normals.reshape(-1, 3)[md3loops]))
+
+    def pack_surface_ST(self, f, i):
         if self.mesh_uvmap_name is None:
             s, t = 0.0, 0.0
         else:
             loop_idx = self.mesh_md3vert_to_loop[i]
             s, t = self.mesh.uv_layers[self.mesh_uvmap_name].data[loop_idx].uv
-        return fmt.TexCoord.pack(s, t)
+        f.pack(fmt.TexCoord, s, t)
 
     def switch_frame(self, i):
         self.scene.frame_set(self.scene.frame_start + i)
 
-    def surface_start_frame(self, i):
-        self.switch_frame(i)
-        obj = bpy.context.view_layer.objects.active
+    def evaluate_surface(self, obj):
+        'Getting the mesh of obj at the current frame'
         self.mesh_matrix = obj.matrix_world
         obj.update_from_editmode()
         dg = bpy.context.evaluated_depsgraph_get()
@@ -205,7 +239,8 @@ class MD3Exporter:
                 else:
                     self.mesh_sk_abs = (a, b, (e - kblocks[a].frame) / (kblocks[b].frame - kblocks[a].frame))
 
-    def pack_surface(self, surf_name):
+    def prepare_surface(self, surf_name):
+        'Packing all of a surface but the vertices, returning a SurfaceCapture for them'
         obj = self.scene.objects[surf_name]
         bpy.context.view_layer.objects.active = obj
         
@@ -213,9 +248,16 @@ class MD3Exporter:
         self.mesh = obj.to_mesh(preserve_all_data_layers=True, depsgraph=dg)
 
         self.mesh_uvmap_name, self.mesh_shader_list = gather_shader_info(self.mesh)
+        uvmap_data = None if self.mesh_uvmap_name is None else self.mesh.uv_layers[self.mesh_uvmap_name].data
+        frame_co = None
+        if self.weld_vertices and self.nFrames == 1:
+            # positions of the one exported frame, already switched to
+            mesh = self.mesh
+            self.evaluate_surface(obj)
+            frame_co = self.get_evaluated_vertex_co()
+            self.mesh = mesh
         self.mesh_md3vert_to_loop, self.mesh_loop_to_md3vert = gather_vertices(
-            self.mesh,
-            None if self.mesh_uvmap_name is None else self.mesh.uv_layers[self.mesh_uvmap_name].data)
+            self.mesh, uvmap_data, self.weld_vertices, frame_co)
 
         nShaders = len(self.mesh_shader_list)
         nVerts = len(self.mesh_md3vert_to_loop)
@@ -247,9 +289,9 @@ class MD3Exporter:
                 # Find the original loop index that corresponds to this bmesh loop
                 # This is a bit complex because we need to map back to the original mesh
                 for orig_loop_idx, md3vert_idx in enumerate(self.mesh_loop_to_md3vert):
-                    if (self.mesh.loops[orig_loop_idx].vertex_index == loop.vert.index and
-                        orig_loop_idx in loop_to_md3vert_map):
-                        loop_indices.append(orig_loop_idx)
+                    if self.mesh.loops[orig_loop_idx].vertex_index == loop.vert.index:
+                        # the loop an md3 vertex was made of, which can be of another vertex when welded
+                        loop_indices.append(self.mesh_md3vert_to_loop[md3vert_idx])
                         break
             
             if len(loop_indices) == 3:
@@ -264,26 +306,28 @@ class MD3Exporter:
         # Clean up bmesh
         bm.free()
         
-        self.scene.frame_set(self.scene.frame_start)
-
-        f = OffsetBytesIO(start_offset=fmt.Surface.size)
-        f.mark('offShaders')
-        f.write(b''.join([self.pack_surface_shader(i) for i in range(nShaders)]))
-        f.mark('offTris')
+        offsets = fmt.surface_offsets(nShaders, nTris_actual, nVerts, self.nFrames)
+        f = SizedOffsetBytesIO(offsets['offVerts'])
+        f.pack(
+            fmt.Surface,
+            magic=fmt.MAGIC,
+            name=prepare_name(obj.name),
+            flags=0,  # ignored
+            nFrames=self.nFrames,
+            nShaders=nShaders,
+            nVerts=nVerts,
+            nTris=nTris_actual,
+            **offsets
+        )
+        for i in range(nShaders):
+            self.pack_surface_shader(f, i)
         
         # Write all triangles
-        triangle_data = b''.join([fmt.Triangle.pack(a, b, c) for a, b, c in triangulated_faces])
-        f.write(triangle_data)
+        for a, b, c in triangulated_faces:
+            f.pack(fmt.Triangle, a, b, c)
         
-        f.mark('offST')
-        f.write(b''.join([self.pack_surface_ST(i) for i in range(nVerts)]))
-        f.mark('offVerts')
-
-        for frame in range(self.nFrames):
-            self.surface_start_frame(frame)
-            f.write(b''.join([self.pack_surface_vert(frame, i) for i in range(nVerts)]))
-
-        f.mark('offEnd')
+        for i in range(nVerts):
+            self.pack_surface_ST(f, i)
 
         print('Surface {}: nVerts={}{} nTris={}{} nShaders={}{}'.format(
             surf_name,
@@ -291,45 +335,35 @@ class MD3Exporter:
             nTris_actual, ' (Too many!)' if nTris_actual > 8192 else '',
             nShaders, ' (Too many!)' if nShaders > 256 else '',
         ))
-
-        return fmt.Surface.pack(
-            magic=fmt.MAGIC,
-            name=prepare_name(obj.name),
-            flags=0,  # ignored
-            nFrames=self.nFrames,
-            nShaders=nShaders,
-            nVerts=nVerts,
-            nTris=nTris_actual,
-            **f.getoffsets()
-        ) + f.getvalue()
+        if self.weld_vertices:
+            welded = len(gather_vertices(self.mesh, uvmap_data)[0]) - nVerts
+            self.welded += welded
+            print('Surface {}: welding saved {} vertices'.format(surf_name, welded))
+        return SurfaceCapture(obj, bytes(f.getvalue()), self.mesh_md3vert_to_loop, offsets['offEnd'])
+
+    def capture_frames(self, file, surfaces):
+        'Visiting every export frame once, writing surface vertices to file, returning packed tags'
+        tags = SizedOffsetBytesIO(self.nFrames * len(self.tagNames) * fmt.Tag.size)
+        for frame in range(self.nFrames):
+            self.switch_frame(frame)
+            for name in self.tagNames:
+                self.pack_tag(tags, name)
+            for surface in surfaces:
+                self.evaluate_surface(surface.obj)
+                self.mesh_md3vert_to_loop = surface.md3vert_to_loop
+                file.seek(surface.vertices_offset(frame))
+                self.write_surface_verts(file, frame)
+        return tags.getvalue()
 
     def get_frame_data(self, i):
-        center = mathutils.Vector((0.0, 0.0, 0.0))
-        x1, x2, y1, y2, z1, z2 = [0.0] * 6
-        first = True
-        for co in self.mesh_vco[i]:
-            if first:
-                x1, x2 = co.x, co.x
-                y1, y2 = co.y, co.y
-                z1, z2 = co.z, co.z
-            else:
-                x1, y1, z1 = min(co.x, x1), min(co.y, y1), min(co.z, z1)
-                x2, y2, z2 = max(co.x, x2), max(co.y, y2), max(co.z, z2)
-            first = False
-            center += co
-        if len(self.mesh_vco[i]):  # issue #9
-            center /= len(self.mesh_vco[i])  # TODO: can be very distorted
-        r = 0.0
-        for co in self.mesh_vco[i]:
-            r = max(r, (co - center).length_squared)
-        r = sqrt(r)
+        lower, upper, r = self.bounds[i]
         return {
-            'minBounds': (x1, y1, z1),
-            'maxBounds': (x2, y2, z2),
+            'minBounds': tuple(lower.tolist()),
+            'maxBounds': tuple(upper.tolist()),
             'radius': r,  # TODO: not sure the radius is measured from center, and not localOrigin
         }
 
-    def pack_frame(self, i):
+    def pack_frame(self, f, i):
         track_name = "Q3ANIM"
         frame_name = 'Unknown'
         
@@ -350,7 +384,8 @@ class MD3Exporter:
                     frame_name = f"{active_strip.name}_{int(frame_number)}"
         
         # Pack the frame with the determined name
-        return fmt.Frame.pack(
+        f.pack(
+            fmt.Frame,
             localOrigin=(0.0, 0.0, 0.0),
             name=frame_name,
             **self.get_frame_data(i)
@@ -371,25 +406,27 @@ class MD3Exporter:
                 self.surfNames.append(o.name)
             elif o.type == 'EMPTY' and o.empty_display_type == 'ARROWS':
                 self.tagNames.append(o.name)
-        self.mesh_vco = defaultdict(list)
 
-        tags_bin = self.pack_animated_tags()
-        surfaces_bin = [self.pack_surface(name) for name in self.surfNames]
-        frames_bin = [self.pack_frame(i) for i in range(self.nFrames)]
-
-        if len(surfaces_bin) == 0:
+        if len(self.surfNames) == 0:
             print("WARNING: There're no visible surfaces to export")
 
-        f = OffsetBytesIO(start_offset=fmt.Header.size)
-        f.mark('offFrames')
-        f.write(b''.join(frames_bin))
-        f.mark('offTags')
-        f.write(tags_bin)
-        f.mark('offSurfaces')
-        f.write(b''.join(surfaces_bin))
-        f.mark('offEnd')
-
+        # the timeline is swept once for everything, vertices of each frame go straight to
+        # their place in the file, the header and tables in front of them come last
+        if self.weld_vertices and self.nFrames == 1:
+            self.switch_frame(0)  # welding compares the positions of that frame
+        surfaces = [self.prepare_surface(name) for name in self.surfNames]
+        offsets = fmt.header_offsets(self.nFrames, len(self.tagNames), sum(surface.size for surface in surfaces))
         with open(filename, 'wb') as file:
+            offset = offsets['offSurfaces']
+            for surface in surfaces:
+                surface.offset = offset
+                file.seek(offset)
+                file.write(surface.head)
+                offset += surface.size
+            self.bounds = FrameBounds(self.nFrames)
+            tags = self.capture_frames(file, surfaces)
+
+            file.seek(0)
             file.write(fmt.Header.pack(
                 magic=fmt.MAGIC,
                 version=fmt.VERSION,
@@ -397,9 +434,18 @@ class MD3Exporter:
                 flags=0,  # ignored
                 nFrames=self.nFrames,
                 nTags=len(self.tagNames),
-                nSurfaces=len(surfaces_bin),
+                nSurfaces=len(self.surfNames),
                 nSkins=0,  # count of skins, ignored
-                **f.getoffsets()
+                **offsets
             ))
+            f = SizedOffsetBytesIO(self.nFrames * fmt.Frame.size)
+            for i in range(self.nFrames):
+                self.pack_frame(f, i)
             file.write(f.getvalue())
-            print('nFrames={} nSurfaces={}'.format(self.nFrames, len(surfaces_bin)))
+            file.write(tags)
+            assert file.tell() == offsets['offSurfaces']
+            end = file.seek(0, os.SEEK_END)
+            assert end == offsets['offEnd']
+            print('nFrames={} nSurfaces={}'.format(self.nFrames, len(self.surfNames)))
+            if self.weld_vertices:
+                print('Welding saved {} vertices'.format(self.welded))
@@ -26,6 +26,9 @@ class Q3AnimationConfigProperties(bpy.types.PropertyGroup):
     anim_cfg_enabled: bpy.props.BoolProperty(name="Animation Config", default=True, description="Generate animation.cfg on export")
     skin_enabled: bpy.props.BoolProperty(name="Skin Config", default=True, description="Generate .skin file templates on export")
     scale_multiplier: bpy.props.IntProperty(name="Model Scale", default=10, description="Scale up model by a multiplier")
+    weld_vertices: bpy.props.BoolProperty(
+        name="Weld Vertices", default=False,
+        description="Merge vertices that are the same once quantized to md3 precision (int16 position, 8-bit normal)")
     timeline_method: bpy.props.EnumProperty(
         items=[
             ("nla", "NLA strips", "Process NLA strips for frame packing and frame information"),
@@ -87,6 +90,8 @@ class Q3AnimationConfigPanel(bpy.types.Panel):
         row = layout.row()
         row.prop(q3_props, "scale_multiplier", text="Model Scale Multiplier")
         row = layout.row()
+        row.prop(q3_props, "weld_vertices", toggle=False)
+        row = layout.row()
         row.prop(q3_props, "modeltype")
 
         if not q3_props.modeltype == "static":
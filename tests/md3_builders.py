@@ -0,0 +1,43 @@
+'''Hand-packed md3 files for the tests'''
+import numpy
+
+from io_scene_md3 import fmt_md3 as fmt
+
+
+def build_surface(name, nFrames, nVerts):
+    co = numpy.arange(nFrames * nVerts * 3, dtype=numpy.float64).reshape(nFrames, nVerts, 3)
+    normals = numpy.tile((0.0, 0.0, 1.0), (nFrames, nVerts, 1))
+    sections = [
+        ('offShaders', fmt.Shader.pack(name + '/skin', 0)),
+        ('offTris', fmt.Triangle.pack_many([(i, (i + 1) % nVerts, (i + 2) % nVerts) for i in range(nVerts)])),
+        ('offST', fmt.TexCoord.pack_many([(i / nVerts, 0.25) for i in range(nVerts)])),
+        ('offVerts', fmt.encode_vertices(co, normals)),
+    ]
+    offsets = {}
+    pos = fmt.Surface.size
+    for field, data in sections:
+        offsets[field] = pos
+        pos += len(data)
+    header = fmt.Surface.pack(
+        magic=fmt.MAGIC, name=name, flags=0, nFrames=nFrames, nShaders=1,
+        nVerts=nVerts, nTris=nVerts, offEnd=pos, **offsets)
+    return header + b''.join(data for _, data in sections)
+
+
+def build_md3(nFrames=2, nTags=1, surfaces=(('body', 3),)):
+    frames = fmt.Frame.pack_many([
+        ((0.0, 0.0, 0.0), (1.0, 1.0, 1.0), (0.0, 0.0, 0.0), 1.0, 'frame{}'.format(i))
+        for i in range(nFrames)])
+    tags = fmt.Tag.pack_many([
+        ('tag_{}'.format(t), (float(f), 0.0, 0.0), (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0))
+        for f in range(nFrames) for t in range(nTags)])
+    surfs = b''.join(build_surface(name, nFrames, nVerts) for name, nVerts in surfaces)
+    offFrames = fmt.Header.size
+    return fmt.Header.pack(
+        magic=fmt.MAGIC, version=fmt.VERSION, modelname='model', flags=0,
+        nFrames=nFrames, nTags=nTags, nSurfaces=len(surfaces), nSkins=0,
+        offFrames=offFrames,
+        offTags=offFrames + len(frames),
+        offSurfaces=offFrames + len(frames) + len(tags),
+        offEnd=offFrames + len(frames) + len(tags) + len(surfs),
+    ) + frames + tags + surfs
@@ -0,0 +1,63 @@
+import pytest
+
+from io_scene_md3.animation_cfg import FrameSelection, parse_animation_cfg
+
+
+CFG = '''// animation config file
+
+sex m
+footsteps normal
+headoffset 0 0 0
+
+0	30	0	25		// BOTH_DEATH1
+29	1	0	25		// BOTH_DEAD1
+30	30	0	25		// BOTH_DEATH2
+59	1	0	25		// BOTH_DEAD2
+60	30	0	25		// BOTH_DEATH3
+89	1	0	25		// BOTH_DEAD3
+90	40	0	20		// TORSO_GESTURE
+130	6	0	15		// TORSO_ATTACK
+136	6	0	15		// TORSO_ATTACK2
+142	5	0	20		// TORSO_DROP
+147	4	0	20		// TORSO_RAISE
+151	1	0	15		// TORSO_STAND
+152	1	0	15		// TORSO_STAND2
+153	8	8	20		// LEGS_WALKCR
+161	12	12	20		// LEGS_WALK
+173	9	9	18		// LEGS_RUN
+182	10	10	20		// LEGS_BACK
+192	10	10	15		// LEGS_SWIM
+202	8	0	15		// LEGS_JUMP
+210	1	0	15		// LEGS_LAND
+211	8	0	15		// LEGS_JUMPB
+219	1	0	15		// LEGS_LANDB
+220	10	10	15		// LEGS_IDLE
+230	-8	8	15		// LEGS_IDLECR
+238	7	7	15		// LEGS_TURN
+'''
+
+
+def test_parse_animation_cfg():
+    animations = parse_animation_cfg(CFG)
+    assert len(animations) == 25
+    assert animations['TORSO_GESTURE'] == ('TORSO_GESTURE', 90, 40, 0, 20)
+    # legs frames follow the death animations in lower.md3
+    assert animations['LEGS_WALKCR'].firstFrame == 90
+    assert animations['LEGS_RUN'] == ('LEGS_RUN', 110, 9, 9, 18)
+    assert animations['LEGS_IDLECR'].numFrames == 8
+
+
+def test_frame_selection(tmpdir):
+    path = tmpdir / 'lower.md3'
+    assert FrameSelection().frames(str(path), 5).tolist() == [0, 1, 2, 3, 4]
+    assert FrameSelection(1, 7, 2).frames(str(path), 5).tolist() == [1, 3]
+    with pytest.raises(ValueError):
+        FrameSelection(animations=['LEGS_RUN']).frames(str(path), 200)
+    (tmpdir / 'animation.cfg').write_text(CFG)
+    selection = FrameSelection(animations=['LEGS_RUN', 'BOTH_DEAD1'])
+    assert selection.frames(str(path), 200).tolist() == list(range(110, 119)) + [29]
+    assert FrameSelection(end=112, animations=['LEGS_RUN']).frames(str(path), 200).tolist() == [110, 111, 112]
+    with pytest.raises(ValueError):
+        FrameSelection(animations=['LEGS_FLY']).frames(str(path), 200)
+    with pytest.raises(ValueError):
+        selection.frames(str(path), 20)
@@ -1,5 +1,6 @@
 import bpy
 from io_scene_md3.export_md3 import MD3Exporter
+from io_scene_md3.md3file import MD3File
 
 
 def test_export_doesnt_crash(tmpdir, simple_blend):
@@ -7,3 +8,60 @@ def test_export_doesnt_crash(tmpdir, simple_blend):
     MD3Exporter(bpy.context)(str(fname))
     assert fname.exists()
     assert fname.stat().st_size > 0
+
+
+def make_selected_object(name, verts, faces):
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(verts, [], faces)
+    mesh.update()
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    bpy.ops.object.select_all(action='DESELECT')
+    obj.select_set(True)
+    return obj
+
+
+def test_export_weld_vertices(tmpdir, simple_blend):
+    # flat shaded, slightly folded quad: the shared corners get normals
+    # that differ in float but not once encoded (away from the poles,
+    # where longitude still counts)
+    make_selected_object('folded', [(0, 0, 0), (0, 1, 0), (0, 0, 1), (1e-4, 1, 1)], [(0, 1, 2), (1, 3, 2)])
+    fname = tmpdir / 'welded.md3'
+    exporter = MD3Exporter(bpy.context, weld_vertices=True)
+    exporter(str(fname))
+    assert exporter.welded == 2
+    with MD3File(str(fname)) as md3:
+        assert md3.surfaces[0].nVerts == 4
+
+
+def test_export_weld_keeps_vertices_moving_apart(tmpdir, simple_blend):
+    # vertex 0 and 3 meet at rest, a hook lifts the second triangle in the last frame
+    # (shape keys would stop the exporter from applying its triangulate modifier)
+    hook = bpy.data.objects.new('lift', None)
+    bpy.context.scene.collection.objects.link(hook)
+    obj = make_selected_object(
+        'apart',
+        [(0, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, 0), (-1, 0, 0), (0, -1, 0)],
+        [(0, 1, 2), (3, 4, 5)])
+    modifier = obj.modifiers.new('lift', 'HOOK')
+    modifier.object = hook
+    modifier.vertex_indices_set([3, 4, 5])
+    scene = bpy.context.scene
+    scene.frame_start, scene.frame_end = 1, 2
+    for frame, z in ((1, 0.0), (2, 1.0)):
+        hook.location = (0.0, 0.0, z)
+        hook.keyframe_insert('location', frame=frame)
+    scene.frame_set(1)
+
+    fname = tmpdir / 'apart.md3'
+    MD3Exporter(bpy.context, weld_vertices=True)(str(fname))
+    with MD3File(str(fname)) as md3:
+        surface = md3.surfaces[0]
+        assert surface.nVerts == 6
+        assert sorted(surface.positions(1)[:, 2].tolist()) == [0.0, 0.0, 0.0, 1.0, 1.0, 1.0]
+
+    # one frame only: the meeting vertices are welded
+    scene.frame_end = 1
+    exporter = MD3Exporter(bpy.context, weld_vertices=True)
+    exporter(str(fname))
+    assert exporter.welded == 1
@@ -0,0 +1,93 @@
+from struct import error as StructError
+
+import numpy
+import pytest
+
+from io_scene_md3 import fmt_md3 as fmt
+
+
+def make_vertex_block(nVerts, nFrames, seed=0):
+    rnd = numpy.random.RandomState(seed)
+    co = rnd.uniform(-500.0, 500.0, (nFrames, nVerts, 3))
+    normals = rnd.normal(size=(nFrames, nVerts, 3))
+    normals /= numpy.linalg.norm(normals, axis=-1, keepdims=True)
+    return co, normals
+
+
+def test_encode_vertices_matches_scalar():
+    co, normals = make_vertex_block(50, 3)
+    expected = b''.join(
+        fmt.Vertex.pack(*c, normal=tuple(n))
+        for c, n in zip(co.reshape(-1, 3), normals.reshape(-1, 3)))
+    assert fmt.encode_vertices(co, normals) == expected
+
+
+def test_decode_vertices_matches_scalar():
+    co, normals = make_vertex_block(50, 3)
+    data = fmt.encode_vertices(co, normals)
+    got_co, got_normals = fmt.decode_vertices(data, 50, 3)
+    assert got_co.shape == got_normals.shape == (3, 50, 3)
+    for i in range(150):
+        v = fmt.Vertex.unpack(data[i * fmt.Vertex.size:(i + 1) * fmt.Vertex.size])
+        numpy.testing.assert_allclose(got_co.reshape(-1, 3)[i], (v.x, v.y, v.z), rtol=1e-6)
+        numpy.testing.assert_allclose(got_normals.reshape(-1, 3)[i], v.normal, atol=1e-6)
+
+
+def test_decode_vertices_offset():
+    co, normals = make_vertex_block(10, 2)
+    data = b'\0' * 7 + fmt.encode_vertices(co, normals)
+    got_co, _ = fmt.decode_vertices(data, 10, 2, offset=7)
+    numpy.testing.assert_allclose(got_co, numpy.trunc(co * 64) / 64, rtol=1e-6)
+
+
+def test_encode_vertices_out_of_range():
+    co, normals = make_vertex_block(1, 1)
+    co[0, 0, 2] = 512.0
+    with pytest.raises(StructError):
+        fmt.encode_vertices(co, normals)
+
+
+def test_normal_table_matches_scalar():
+    b = numpy.stack(numpy.meshgrid(numpy.arange(256), numpy.arange(256), indexing='ij'), axis=-1)
+    got = fmt.decode_normals(b.astype(numpy.uint8))
+    expected = numpy.array([
+        [fmt.decode_normal((lat, lon)) for lon in range(256)]
+        for lat in range(256)], dtype=numpy.float32)
+    assert (got == expected).all()
+
+
+def test_encode_normals_matches_scalar():
+    _, normals = make_vertex_block(5000, 1, seed=1)
+    normals = normals.reshape(-1, 3)
+    # axes, poles and directions lying exactly on quantization steps
+    special = [(0, 0, 1), (0, 0, -1), (1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 0)]
+    special.extend(fmt.decode_normal((lat, lon)) for lat in range(0, 256, 15) for lon in range(0, 256, 15))
+    normals = numpy.concatenate((normals, numpy.array(special, dtype=numpy.float64)))
+    expected = [tuple(fmt.encode_normal(tuple(n))) for n in normals.tolist()]
+    assert [tuple(v) for v in fmt.encode_normals(normals).tolist()] == expected
+
+
+def test_layout_offsets():
+    offsets = fmt.surface_offsets(nShaders=2, nTris=3, nVerts=4, nFrames=5)
+    assert offsets['offShaders'] == fmt.Surface.size
+    assert offsets['offTris'] - offsets['offShaders'] == 2 * fmt.Shader.size
+    assert offsets['offST'] - offsets['offTris'] == 3 * fmt.Triangle.size
+    assert offsets['offVerts'] - offsets['offST'] == 4 * fmt.TexCoord.size
+    assert offsets['offEnd'] - offsets['offVerts'] == 5 * 4 * fmt.Vertex.size
+    header = fmt.header_offsets(nFrames=5, nTags=2, surfaces_size=offsets['offEnd'])
+    assert header['offFrames'] == fmt.Header.size
+    assert header['offSurfaces'] - header['offTags'] == 5 * 2 * fmt.Tag.size
+    assert header['offEnd'] - header['offSurfaces'] == offsets['offEnd']
+
+
+def test_decode_triangles():
+    records = [(0, 1, 2), (2, 1, 3), (4, 5, 6)]
+    data = b'\0' * 4 + fmt.Triangle.pack_many(records)
+    assert fmt.decode_triangles(data, 3, offset=4).tolist() == [list(r) for r in records]
+
+
+def test_decode_texcoords_matches_scalar():
+    records = [(0.0, 0.0), (0.25, 0.75), (1.5, -0.3), (0.1, 0.9)]
+    data = fmt.TexCoord.pack_many(records)
+    expected = [fmt.TexCoord.unpack(data[i * 8:(i + 1) * 8]) for i in range(4)]
+    assert (fmt.decode_texcoords(data, 4) == numpy.array(expected, dtype=numpy.float32)).all()
@@ -0,0 +1,48 @@
+import bpy
+
+import io_scene_md3
+
+from io_scene_md3.import_md3 import MD3Importer, import_md3_files
+from io_scene_md3.synth_md3 import generate_md3
+
+
+def test_shape_key_curve_hits_every_key(tmpdir, simple_blend):
+    fname = tmpdir / 'animated.md3'
+    fname.write_bytes(generate_md3(nFrames=5, resolution=(2, 2)))
+    MD3Importer(bpy.context)(str(fname))
+    shape_keys = bpy.context.scene.objects['surface0'].data.shape_keys
+    fcurve = shape_keys.animation_data.action.fcurves.find('eval_time')
+    key_blocks = shape_keys.key_blocks
+    assert len(key_blocks) == 5
+    for i, key_block in enumerate(key_blocks):
+        assert abs(fcurve.evaluate(i) - key_block.frame) < 1e-4
+
+
+def test_batch_keeps_textures_of_each_model(tmpdir, simple_blend):
+    filenames = []
+    for name in ('red', 'blue'):
+        directory = tmpdir / 'batch' / name
+        directory.mkdir(parents=True)
+        image = bpy.data.images.new(name, 2, 2)
+        image.filepath_raw = str(directory / 'skin.png')
+        image.file_format = 'PNG'
+        image.save()
+        filename = directory / 'model.md3'
+        filename.write_bytes(generate_md3(shaders=('skin',), modelname=name))
+        filenames.append(str(filename))
+    assert import_md3_files(bpy.context, filenames, workers=1) == []
+    surfaces = sorted((o for o in bpy.context.scene.objects if o.name.startswith('surface0')), key=lambda o: o.name)
+    images = [o.data.materials[0].node_tree.nodes['Image Texture'].image for o in surfaces]
+    assert [bpy.path.abspath(i.filepath) for i in images] == [
+        str(tmpdir / 'batch' / name / 'skin.png') for name in ('red', 'blue')]
+
+
+def test_operator_imports_before_returning(tmpdir, simple_blend):
+    fname = tmpdir / 'scripted.md3'
+    fname.write_bytes(generate_md3(nFrames=2, resolution=(2, 2)))
+    io_scene_md3.register()
+    try:
+        assert bpy.ops.import_scene.md3(filepath=str(fname)) == {'FINISHED'}
+        assert 'surface0' in bpy.context.scene.objects
+    finally:
+        io_scene_md3.unregister()
@@ -0,0 +1,38 @@
+from io import StringIO
+
+from io_scene_md3.inspect_md3 import main
+
+from md3_builders import build_md3
+
+
+def run(*argv):
+    out = StringIO()
+    code = main(list(argv), out=out)
+    return code, out.getvalue()
+
+
+def test_inspect_good_tree(tmpdir):
+    (tmpdir / 'models' / 'sub').mkdir(parents=True)
+    (tmpdir / 'models' / 'sub' / 'a.md3').write_bytes(build_md3(surfaces=(('body', 4), ('head', 5))))
+    (tmpdir / 'models' / 'b.MD3').write_bytes(build_md3(nFrames=1))
+    code, out = run('info', str(tmpdir / 'models'))
+    assert code == 0
+    assert "surface 1 'head': nVerts=5/4096" in out
+    code, out = run('validate', str(tmpdir / 'models'))
+    assert (code, out.strip()) == (0, '0 of 2 files have problems')
+    code, out = run('stats', str(tmpdir / 'models'))
+    assert code == 0
+    assert 'files=2 invalid=0' in out
+    assert 'verts      total=12' in out
+
+
+def test_inspect_broken_files(tmpdir):
+    data = build_md3()
+    (tmpdir / 'broken').mkdir()
+    (tmpdir / 'broken' / 'truncated.md3').write_bytes(data[:len(data) - 10])
+    (tmpdir / 'broken' / 'garbage.md3').write_bytes(b'junk')
+    code, out = run('validate', str(tmpdir / 'broken'))
+    assert code == 1
+    assert 'offEnd={} but file size is {}'.format(len(data), len(data) - 10) in out
+    assert 'too short' in out
+    assert '2 of 2 files have problems' in out
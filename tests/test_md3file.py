@@ -0,0 +1,127 @@
+from struct import error as StructError
+
+import numpy
+import pytest
+
+from io_scene_md3 import fmt_md3 as fmt
+from io_scene_md3.animation_cfg import FrameSelection
+from io_scene_md3.md3file import MD3File, PC2Header, decode_md3
+from io_scene_md3.utils import StageTimer
+
+from md3_builders import build_md3
+
+
+@pytest.fixture
+def md3_path(tmpdir):
+    path = tmpdir / 'model.md3'
+    path.write_bytes(build_md3(nFrames=3, nTags=2, surfaces=(('body', 4), ('head', 5))))
+    return path
+
+
+def test_md3file_reads_everything(md3_path):
+    with MD3File(str(md3_path)) as md3:
+        assert md3.header.nSurfaces == 2
+        assert [f.name for f in md3.frames] == ['frame0', 'frame1', 'frame2']
+        assert [t.name for t in md3.tags(2)] == ['tag_0', 'tag_1']
+        assert md3.tags(2)[1].origin == (2.0, 0.0, 0.0)
+        body, head = md3.surfaces
+        assert (body.name, head.name) == ('body', 'head')
+        assert head.shaders[0].name == 'head/skin'
+        assert head.triangles.tolist()[4] == [4, 0, 1]
+        assert numpy.allclose(head.texcoords[2], (0.4, 0.75))  # stored t is inverted
+        assert head.vertex_records.shape == (3, 5)
+        assert (head.triangles.dtype.str, head.texcoords.dtype.str) == ('<i4', '<f4')  # little-endian on any host
+        co, normals = head.vertices(1)
+        assert co[0].tolist() == [15.0, 16.0, 17.0]
+        assert normals[0].tolist() == [0.0, 0.0, 1.0]
+        assert len(head.vertex_block(2)) == 5 * fmt.Vertex.size
+
+
+def test_md3file_close_unmaps(md3_path):
+    with MD3File(str(md3_path)) as md3:
+        for surface in md3.surfaces:
+            surface.triangles, surface.texcoords, surface.vertex_records
+    assert md3.mmap.closed
+    md3 = MD3File(str(md3_path))
+    triangles = md3.surfaces[0].triangles
+    with pytest.raises(BufferError):
+        md3.close()
+    del triangles
+    md3.close()
+    assert md3.mmap.closed
+
+
+def test_md3file_rejects_garbage(tmpdir):
+    path = tmpdir / 'garbage.md3'
+    path.write_bytes(b'\0' * 200)
+    with pytest.raises(ValueError):
+        MD3File(str(path))
+
+
+@pytest.mark.parametrize('fraction', [0.3, 0.5, 0.7, 0.9])
+def test_decode_md3_truncated(tmpdir, fraction):
+    data = build_md3(nFrames=3, nTags=2, surfaces=(('body', 4), ('head', 5)))
+    path = tmpdir / 'truncated.md3'
+    path.write_bytes(data[:int(len(data) * fraction)])
+    with pytest.raises((StructError, ValueError)):  # not BufferError from closing the map
+        decode_md3(str(path))
+
+
+def test_decode_md3(md3_path):
+    timer = StageTimer()
+    model = decode_md3(str(md3_path), timer=timer)
+    assert set(timer.totals) == {'header', 'tags', 'shaders', 'triangles', 'UVs', 'verts'}
+    assert model.header.nFrames == 3
+    assert [t.name for t in model.tag_records] == ['tag_0', 'tag_1'] * 3
+    body, head = model.surfaces
+    assert head.header.name == 'head'
+    assert head.shaders[0].name == 'head/skin'
+    assert head.triangles.flags.owndata
+    assert head.co.shape == (3, 5, 3)
+    assert head.co[1, 0].tolist() == [15.0, 16.0, 17.0]
+    assert head.normals.shape == (5, 3)
+    assert numpy.allclose(head.uv[2], (0.4, 0.25))
+    with MD3File(str(md3_path)) as md3:
+        co, normals = md3.surfaces[1].vertices(2)
+        assert (head.co[2] == co).all()
+
+
+def test_decode_md3_selected_frames(md3_path):
+    model = decode_md3(str(md3_path), FrameSelection(start=1, step=2))
+    assert model.header.nFrames == 3
+    assert [f.name for f in model.frames] == ['frame1']
+    assert [t.origin[0] for t in model.tag_records] == [1.0, 1.0]
+    assert model.surfaces[1].co.shape == (1, 5, 3)
+    assert model.surfaces[1].co[0, 0].tolist() == [15.0, 16.0, 17.0]
+
+
+def test_decode_md3_point_cache(md3_path):
+    model = decode_md3(str(md3_path), FrameSelection(start=1), point_cache=True)
+    head = model.surfaces[1]
+    assert head.pc2 == str(md3_path)[:-len('.md3')] + '_1_head.pc2'
+    assert head.co.shape == (1, 5, 3)
+    with open(head.pc2, 'rb') as f:
+        data = f.read()
+    assert PC2Header.unpack(data[:PC2Header.size]) == (b'POINTCACHE2\0', 1, 5, 0.0, 1.0, 2)
+    co = numpy.frombuffer(data, dtype='<f4', offset=PC2Header.size).reshape(2, 5, 3)
+    with MD3File(str(md3_path)) as md3:
+        assert (co == md3.surfaces[1].positions([1, 2])).all()
+    assert (co[0] == head.co[0]).all()
+
+
+def test_decode_md3_point_cache_single_frame(tmpdir):
+    path = tmpdir / 'single.md3'
+    path.write_bytes(build_md3(nFrames=3, nTags=2, surfaces=(('body', 4), ('head', 5))))
+    model = decode_md3(str(path), FrameSelection(start=2), point_cache=True)
+    head = model.surfaces[1]
+    assert head.pc2 is None
+    assert not (tmpdir / 'single_1_head.pc2').exists()
+    assert head.co.shape == (1, 5, 3)
+
+
+def test_decode_md3_point_cache_unwritable(tmpdir):
+    path = tmpdir / 'locked.md3'
+    path.write_bytes(build_md3(nFrames=3, nTags=2, surfaces=(('body', 4), ('head', 5))))
+    (tmpdir / 'locked_0_body.pc2').mkdir()  # a directory where the cache should go
+    with pytest.raises(OSError):
+        decode_md3(str(path), point_cache=True)
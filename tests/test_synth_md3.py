@@ -0,0 +1,58 @@
+from io import StringIO
+
+import pytest
+
+from io_scene_md3.inspect_md3 import main, validate
+from io_scene_md3.md3file import MD3File
+from io_scene_md3.synth_md3 import MALFORMATIONS, build_corpus, generate_md3, malform, QUICK_GRID
+from io_scene_md3.utils import StageTimer
+
+
+def problems_of(path):
+    try:
+        md3 = MD3File(str(path))
+    except ValueError as e:
+        return [str(e)]
+    with md3:
+        return validate(md3, StageTimer())
+
+
+@pytest.mark.parametrize('topology', ['grid', 'cylinder', 'sphere'])
+@pytest.mark.parametrize('animation', ['static', 'rigid', 'wave', 'noise'])
+def test_generated_files_are_valid(tmpdir, topology, animation):
+    path = tmpdir / 'synth_{}_{}.md3'.format(topology, animation)
+    path.write_bytes(generate_md3(
+        nFrames=4, surfaces=2, topology=topology, resolution=(3, 5), animation=animation))
+    assert problems_of(path) == []
+    with MD3File(str(path)) as md3:
+        assert md3.header.nFrames == 4
+        assert [t.name for t in md3.tags(3)] == ['tag_head', 'tag_weapon']
+        surface = md3.surfaces[1]
+        assert (surface.nVerts, surface.nTris) == (4 * 6, 3 * 5 * 2)
+        assert surface.shaders[0].name == 'models/synth/skin'
+
+
+@pytest.mark.parametrize('kind', sorted(MALFORMATIONS))
+def test_malformed_files_are_caught(tmpdir, kind):
+    path = tmpdir / 'broken_{}.md3'.format(kind)
+    path.write_bytes(malform(generate_md3(nFrames=3, resolution=(2, 2)), kind, seed=1))
+    assert problems_of(path) != []
+
+
+def test_build_corpus(tmpdir):
+    paths = build_corpus(str(tmpdir / 'corpus'), QUICK_GRID)
+    assert len(paths) == 4 * (1 + len(MALFORMATIONS))
+    assert sum(not problems_of(p) for p in paths) == 4
+
+
+def test_negative_counts_are_reported(tmpdir):
+    path = tmpdir / 'negative.md3'
+    path.write_bytes(malform(generate_md3(nFrames=3, resolution=(2, 2)), 'surface_negative_counts'))
+    problems = problems_of(path)
+    assert 'surface 0 (surface0): nTris=-1 is negative' in problems
+
+
+@pytest.mark.parametrize('command', ['info', 'validate', 'stats'])
+def test_inspect_malformed_corpus(tmpdir, command):
+    build_corpus(str(tmpdir / 'corpus'), QUICK_GRID)
+    assert main([command, str(tmpdir / 'corpus')], out=StringIO()) == 1
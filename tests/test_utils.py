@@ -0,0 +1,183 @@
+import os
+from struct import error as StructError
+
+import numpy
+import pytest
+
+from io_scene_md3.utils import (
+    AnyStruct, FileIndex, FrameBounds, SizedOffsetBytesIO, matrix_to_quaternion, unique_loops, weld_loops)
+
+
+Sample = AnyStruct('Sample', (
+    ('name', '8s', 1, lambda b: b.rstrip(b'\0').decode(), str.encode),
+    ('origin', '3f', 3),
+    ('count', 'i'),
+    ('scaled', 'h', 1, lambda v: v / 2, lambda v: int(v * 2)),
+))
+
+
+def test_anystruct_roundtrip():
+    data = Sample.pack('abc', (1.0, 2.0, 3.0), 7, scaled=4.5)
+    assert len(data) == Sample.size
+    value = Sample.unpack(data)
+    assert value == ('abc', (1.0, 2.0, 3.0), 7, 4.5)
+    assert value.origin == (1.0, 2.0, 3.0)
+    assert type(value) is Sample.ntuple_cls
+
+
+def test_anystruct_pack_arguments():
+    assert Sample.pack('a', (0, 0, 0), 1, 2) == Sample.pack(scaled=2, count=1, origin=(0, 0, 0), name='a')
+    with pytest.raises(TypeError):
+        Sample.pack('a', (0, 0, 0), 1)
+    with pytest.raises(AssertionError):
+        Sample.pack('a', (0, 0), 1, 2)
+
+
+def test_anystruct_many():
+    records = [('r{}'.format(i), (i, i + 1.0, i + 2.0), i * 3, i / 2) for i in range(5)]
+    data = Sample.pack_many(records)
+    assert data == b''.join(Sample.pack(*r) for r in records)
+    assert Sample.unpack_many(b'xx' + data, 5, offset=2) == records
+    assert Sample.unpack_many(data, 2, offset=Sample.size * 3) == records[3:]
+    assert Sample.unpack_many(data, 0) == []
+
+
+def test_anystruct_unpack_many_short_buffer():
+    data = Sample.pack_many([('a', (0, 0, 0), 0, 0)])
+    with pytest.raises(StructError):
+        Sample.unpack_many(data, 2)
+    with pytest.raises(StructError):
+        Sample.unpack_many(data * 2, 1, -Sample.size)
+
+
+def test_sized_offset_bytes_io():
+    f = SizedOffsetBytesIO(Sample.size * 2 + 3, start_offset=100)
+    f.mark('first')
+    f.pack(Sample, 'a', (1, 2, 3), 4, scaled=5)
+    f.write(b'xyz')
+    f.mark('second')
+    f.pack(Sample, name='b', origin=(0, 0, 0), count=1, scaled=2)
+    assert f.getoffsets() == {'first': 100, 'second': 100 + Sample.size + 3}
+    assert bytes(f.getvalue()) == Sample.pack('a', (1, 2, 3), 4, 5) + b'xyz' + Sample.pack('b', (0, 0, 0), 1, 2)
+    with pytest.raises(StructError):
+        f.pack(Sample, 'c', (0, 0, 0), 0, 0)
+    with pytest.raises(ValueError):
+        f.write(b'!')
+    f.seek(0)
+    f.write(b'!')
+    assert f.getvalue()[:1] == b'!' and len(f.getvalue()) == 1
+
+
+def quaternion_to_matrix(q):
+    w, x, y, z = q
+    return numpy.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ])
+
+
+def test_matrix_to_quaternion():
+    rnd = numpy.random.RandomState(0)
+    q = rnd.normal(size=(200, 4))
+    q /= numpy.linalg.norm(q, axis=-1, keepdims=True)
+    q[q[:, 0] < 0] *= -1
+    # rotations by 180 degrees land in the non-trace branches
+    q[:4] = [(1, 0, 0, 0), (0, 1, 0, 0), (0, 0, 1, 0), (0, 0, 0, 1)]
+    m = numpy.array([quaternion_to_matrix(v) for v in q])
+    m[10:20] *= 3.0  # scale is ignored
+    got = matrix_to_quaternion(m.reshape(20, 10, 3, 3)).reshape(200, 4)
+    assert (got[:, 0] >= 0).all()
+    numpy.testing.assert_allclose(numpy.abs((got * q).sum(axis=-1)), 1.0, atol=1e-9)
+    numpy.testing.assert_allclose(got[4:], q[4:], atol=1e-9)
+
+
+def test_file_index(tmpdir):
+    model = os.path.join(str(tmpdir), 'models', 'players', 'sarge')
+    os.makedirs(os.path.join(model, 'sub'))
+    os.makedirs(os.path.join(str(tmpdir), 'textures'))
+    for path in (os.path.join(model, 'skin.tga'), os.path.join(model, 'sub', 'a.png'),
+                 os.path.join(str(tmpdir), 'textures', 'b.jpg')):
+        open(path, 'wb').close()
+    index = FileIndex()
+    index.scan(model)
+    assert index.isfile(os.path.join(model, 'skin.tga'))
+    assert index.isfile(os.path.join(model, 'sub', '.', 'a.png'))
+    assert not index.isfile(os.path.join(model, 'skin.png'))
+    assert not index.isfile(os.path.join(model, 'sub'))
+    # outside of the scanned tree, listed once on demand
+    assert index.isfile(os.path.join(str(tmpdir), 'textures', 'b.jpg'))
+    os.remove(os.path.join(str(tmpdir), 'textures', 'b.jpg'))
+    assert index.isfile(os.path.join(str(tmpdir), 'textures', 'b.jpg'))
+    assert not index.isfile(os.path.join(str(tmpdir), 'missing', 'c.tga'))
+
+
+def unique_loops_reference(vertex_index, normals, uv):
+    md3vert_to_loop, loop_to_md3vert, index = [], [], {}
+    for i, v in enumerate(vertex_index):
+        key = (v, tuple(normals[i]), None if uv is None else tuple(uv[i]))
+        md3id = index.setdefault(key, len(md3vert_to_loop))
+        if md3id == len(md3vert_to_loop):
+            md3vert_to_loop.append(i)
+        loop_to_md3vert.append(md3id)
+    return md3vert_to_loop, loop_to_md3vert
+
+
+def test_unique_loops():
+    rnd = numpy.random.RandomState(0)
+    n = 3000
+    vertex_index = rnd.randint(0, 200, n)
+    normals = rnd.randint(-1, 2, (n, 3)).astype(numpy.float32) * 0.5
+    normals[::7] *= -1  # -0.0 here and there
+    uv = rnd.randint(0, 3, (n, 2)).astype(numpy.float32) / 4
+    for u in (uv, None):
+        expected = unique_loops_reference(vertex_index.tolist(), normals.tolist(), None if u is None else u.tolist())
+        got = unique_loops(vertex_index, normals.ravel(), None if u is None else u.ravel())
+        assert [a.tolist() for a in got] == [list(e) for e in expected]
+    md3vert_to_loop, loop_to_md3vert = unique_loops([], numpy.zeros(0), numpy.zeros(0))
+    assert len(md3vert_to_loop) == len(loop_to_md3vert) == 0
+
+
+def test_weld_loops():
+    from io_scene_md3 import fmt_md3 as fmt
+    rnd = numpy.random.RandomState(1)
+    n = 2000
+    co = rnd.randint(-1, 1, (n, 3)) / fmt.VERTEX_SCALE + rnd.uniform(0, 0.5 / fmt.VERTEX_SCALE, (n, 3))
+    normals = rnd.randint(-1, 2, (n, 3)) + rnd.uniform(-1e-4, 1e-4, (n, 3))
+    normals /= numpy.maximum(numpy.linalg.norm(normals, axis=1, keepdims=True), 1e-9)
+    uv = rnd.randint(0, 2, (n, 2)).astype(numpy.float32) / 2
+    records = numpy.frombuffer(fmt.encode_vertices(co, normals), dtype=numpy.uint8).reshape(n, -1)
+    keys = [(records[i].tobytes(), tuple(uv[i].tolist())) for i in range(n)]
+    expected = unique_loops_reference([0] * n, [()] * n, keys)
+    md3vert_to_loop, loop_to_md3vert = weld_loops(records, uv.ravel())
+    assert [md3vert_to_loop.tolist(), loop_to_md3vert.tolist()] == [list(e) for e in expected]
+    assert len(md3vert_to_loop) < len(unique_loops(numpy.arange(n), normals.ravel(), uv.ravel())[0])
+    # loops of one vertex only, by quantized normal
+    vertex_index = rnd.randint(0, 50, n)
+    encoded = fmt.encode_normals(normals)
+    keys = [(encoded[i].tobytes(), tuple(uv[i].tolist())) for i in range(n)]
+    expected = unique_loops_reference(vertex_index.tolist(), [()] * n, keys)
+    got = weld_loops(encoded, uv.ravel(), vertex_index)
+    assert [a.tolist() for a in got] == [list(e) for e in expected]
+    assert len(got[0]) < len(unique_loops(vertex_index, normals.ravel(), uv.ravel())[0])
+    md3vert_to_loop, loop_to_md3vert = weld_loops(numpy.zeros((0, 8), dtype=numpy.uint8), None)
+    assert len(md3vert_to_loop) == len(loop_to_md3vert) == 0
+
+
+def test_frame_bounds():
+    rnd = numpy.random.RandomState(2)
+    frames = [[rnd.uniform(-10, 10, (n, 3)) for n in (5, 0, 40)] for _ in range(4)]
+    frames[2] = []
+    bounds = FrameBounds(len(frames))
+    for i, surfaces in enumerate(frames):
+        for co in surfaces:
+            bounds.add(i, co)
+    for i, surfaces in enumerate(frames):
+        lower, upper, radius = bounds[i]
+        if not surfaces:
+            assert lower.tolist() == upper.tolist() == [0.0, 0.0, 0.0] and radius == 0.0
+            continue
+        co = numpy.concatenate(surfaces)
+        assert lower.tolist() == co.min(axis=0).tolist()
+        assert upper.tolist() == co.max(axis=0).tolist()
+        assert radius == pytest.approx(numpy.linalg.norm(co - co.mean(axis=0), axis=1).max())